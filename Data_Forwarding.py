@@ -1,3 +1,7 @@
+import queue
+import socket
+import threading
+
 import paho.mqtt.client as mqtt
 
 # ================= 配置区域 =================
@@ -5,6 +9,9 @@ BROKER_HOST = "47.104.166.179"
 BROKER_PORT = 1883
 MQTT_USER = "mqtt_user"
 MQTT_PASS = "mqtt_password"
+KEEPALIVE = 60  # 心跳间隔（秒）
+MAX_INFLIGHT = 1000  # QoS>0 未确认消息上限
+MAX_QUEUED = 10000  # 发送队列上限
 
 HOST_PUB_PREFIX = "/AIR8000/PUB/"
 HOST_SUB_PREFIX = "/AIR8000/SUB/"
@@ -12,56 +19,98 @@ HOST_SUB_PREFIX = "/AIR8000/SUB/"
 SLAVE_PUB_PREFIX = "/780EHV/PUB/"
 SLAVE_SUB_PREFIX = "/780EHV/SUB/"
 
+# 调试开关：开启后逐条打印消息内容
+DEBUG = False
+
+# Socket 收发缓冲区大小（字节）
+SOCKET_BUFFER_SIZE = 1 << 20
+
 # ===========================================
 
+# 前缀路由表：(发布前缀, 目标订阅前缀, 来源名称)
+PREFIX_TABLE = (
+    (HOST_PUB_PREFIX, SLAVE_SUB_PREFIX, "主机"),
+    (SLAVE_PUB_PREFIX, HOST_SUB_PREFIX, "从机"),
+)
+
 # 全局变量（运行时输入）
 HOST_IMEI = ""
 SLAVE_IMEI = ""
 BINDING_MAP = {}
 
+# 日志队列：回调线程只入队，由日志线程负责输出，避免 print 阻塞网络循环
+_log_queue = queue.SimpleQueue()
+
+
+def log(message):
+    _log_queue.put(message)
+
+
+def _log_worker():
+    while True:
+        print(_log_queue.get())
+
+
+# 预编译路由：来源 Topic -> (来源名称, 发送方IMEI, ((接收方IMEI, 目标Topic), ...))
+ROUTES = {}
+
+
+def reload_routes():
+    """根据 BINDING_MAP 重建 ROUTES，修改绑定关系后调用"""
+    global ROUTES
+    ROUTES = {
+        pub_prefix + sender: (
+            source_name,
+            sender,
+            tuple((receiver, target_sub_prefix + receiver) for receiver in receivers)
+        )
+        for pub_prefix, target_sub_prefix, source_name in PREFIX_TABLE
+        for sender, receivers in BINDING_MAP.items()
+    }
+
+
 def on_connect(client, userdata, flags, rc):
-    print(f"服务器连接成功! 双向监听已启动...")
+    log(f"服务器连接成功! 双向监听已启动...")
+
+    # 关闭 Nagle 算法，转发的小包立即发出；同时放大收发缓冲区
+    sock = client.socket()
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
 
     # 订阅 主机 的发布通道
     client.subscribe(HOST_PUB_PREFIX + "+")
-    print(f"监听主机: {HOST_PUB_PREFIX}+")
+    log(f"监听主机: {HOST_PUB_PREFIX}+")
 
     # 订阅 从机 的发布通道
     client.subscribe(SLAVE_PUB_PREFIX + "+")
-    print(f"监听从机: {SLAVE_PUB_PREFIX}+")
+    log(f"监听从机: {SLAVE_PUB_PREFIX}+")
 
 def on_message(client, userdata, msg):
     try:
-        topic = msg.topic
-        payload = msg.payload.decode('utf-8')
-        sender_imei = ""
-        target_sub_prefix = "" 
-
-        if topic.startswith(HOST_PUB_PREFIX):
-            sender_imei = topic.split(HOST_PUB_PREFIX)[1]
-            target_sub_prefix = SLAVE_SUB_PREFIX
-            print(f"\n主机消息: {sender_imei} -> 发送: {payload}")
-
-        elif topic.startswith(SLAVE_PUB_PREFIX):
-            sender_imei = topic.split(SLAVE_PUB_PREFIX)[1]
-            target_sub_prefix = HOST_SUB_PREFIX
-            print(f"\n从机消息: {sender_imei} -> 发送: {payload}")
-        
-        else:
-            return 
-
-        if sender_imei in BINDING_MAP:
-            receivers = BINDING_MAP[sender_imei]
-            for receiver in receivers:
-                target_topic = target_sub_prefix + receiver
-                client.publish(target_topic, payload)
-                print(f"转发成功 -> 目标设备: {receiver}")
-                print(f"(目标Topic: {target_topic})")
-        else:
-            print(f"未找到绑定关系，不转发")
+        route = ROUTES.get(msg.topic)
+        if route is None:
+            # 非监听 Topic 或未绑定的发送方
+            if DEBUG:
+                log(f"\n收到消息: {msg.topic} -> 未找到绑定关系，不转发")
+            return
+
+        source_name, sender_imei, targets = route
+        payload = msg.payload
+
+        if DEBUG:
+            log(f"\n{source_name}消息: {sender_imei} -> 发送: {payload.decode('utf-8', 'replace')}")
+
+        # 回调内的 publish 只进入发送队列，由网络线程统一写出
+        for receiver, target_topic in targets:
+            client.publish(target_topic, payload, qos=0)
+            if DEBUG:
+                log(f"转发成功 -> 目标设备: {receiver}")
+                log(f"(目标Topic: {target_topic})")
 
     except Exception as e:
-        print(f"系统错误: {e}")
+        log(f"系统错误: {e}")
 
 if __name__ == '__main__':
     # 手动输入 IMEI
@@ -75,15 +124,27 @@ if __name__ == '__main__':
         HOST_IMEI: [SLAVE_IMEI],
         SLAVE_IMEI: [HOST_IMEI]
     }
+    reload_routes()
 
     print(f"主机IMEI: {HOST_IMEI}")
     print(f"从机IMEI: {SLAVE_IMEI}")
     print("=" * 40)
 
+    threading.Thread(target=_log_worker, daemon=True).start()
+
     client = mqtt.Client()
     client.username_pw_set(MQTT_USER, MQTT_PASS)
+    client.max_inflight_messages_set(MAX_INFLIGHT)
+    client.max_queued_messages_set(MAX_QUEUED)
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
     client.on_connect = on_connect
     client.on_message = on_message
     print("正在连接 MQTT Broker...")
-    client.connect(BROKER_HOST, BROKER_PORT, 60)
-    client.loop_forever()
+    client.connect(BROKER_HOST, BROKER_PORT, KEEPALIVE)
+    # 网络循环在后台线程运行，主线程阻塞等待
+    client.loop_start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        client.loop_stop()
+        client.disconnect()
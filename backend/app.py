@@ -1,5 +1,7 @@
 """
-应用入口文件
+应用入口文件（开发环境）
+
+生产环境请使用 gunicorn 启动，见 wsgi.py 和 gunicorn.conf.py；MQTT 服务见 mqtt_worker.py
 """
 import os
 import sys
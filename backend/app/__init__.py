@@ -1,14 +1,45 @@
 """
 Flask 应用工厂
 """
-from flask import Flask, request
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+import orjson
+from flask import Flask, request, g, current_app
+from flask.json.provider import JSONProvider, DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
+from flask_compress import Compress
 
 # 初始化扩展
-db = SQLAlchemy()
+# 提交后不过期已加载对象，避免 to_dict() 时重新查询
+db = SQLAlchemy(session_options={'expire_on_commit': False})
 jwt = JWTManager()
+compress = Compress()
+
+# 登录密码校验执行器按进程创建，见 login_pool()
+_login_pool_lock = threading.Lock()
+
+
+class OrjsonProvider(JSONProvider):
+    """基于 orjson 的 JSON 序列化"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=DefaultJSONProvider.default).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # 直接写出 bytes，省去一次解码
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=DefaultJSONProvider.default),
+            mimetype='application/json'
+        )
 
 
 def create_app(config_name='default'):
@@ -18,10 +49,17 @@ def create_app(config_name='default'):
     app = Flask(__name__, static_folder='../static', static_url_path='')
     app.config.from_object(config_map[config_name])
     
+    missing = [key for key in app.config['REQUIRED_ENV'] if not os.environ.get(key)]
+    if missing:
+        raise RuntimeError(f"缺少必需的环境变量: {', '.join(missing)}")
+    
+    app.json = OrjsonProvider(app)
+    
     # 初始化扩展
     db.init_app(app)
     jwt.init_app(app)
     CORS(app)
+    compress.init_app(app)
     
     # 注册蓝图
     from app.api.auth import auth_bp
@@ -38,6 +76,12 @@ def create_app(config_name='default'):
     app.register_blueprint(alarm_bp, url_prefix='/api/alarms')
     app.register_blueprint(comm_logs_bp)
     
+    @app.before_request
+    def set_request_time():
+        # 每个请求只取一次当前时间，并据此计算设备离线阈值
+        g.now = datetime.now()
+        g.offline_threshold = g.now - timedelta(hours=app.config['DEVICE_OFFLINE_HOURS'])
+    
     # 前端静态文件路由
     @app.route('/')
     def index():
@@ -62,14 +106,58 @@ def create_app(config_name='default'):
         # SPA 路由支持，返回 index.html
         return app.send_static_file('index.html')
     
-    # 创建数据库表和默认管理员
-    with app.app_context():
-        db.create_all()
-        create_default_admin(app)
+    @app.cli.command('db-init')
+    def db_init_command():
+        """创建数据库表和默认管理员"""
+        init_db(app)
+    
+    # 创建数据库表和默认管理员（仅在 RUN_DB_INIT 开启时，避免每个 worker 启动都访问数据库）
+    if app.config['RUN_DB_INIT']:
+        with app.app_context():
+            init_db(app)
     
     return app
 
 
+def login_pool():
+    """获取当前进程的登录密码校验执行器，限制同时进行的哈希计算数量
+    
+    执行器在每个进程首次登录时创建并按进程号记录：进程池的任务队列和管道在创建时就已建立，
+    fork 出的子进程若沿用父进程的执行器，会与父进程及其他子进程共用这些队列。
+    
+    - gevent worker（threading 已被打补丁）：使用 gevent 的原生线程池，哈希计算在真实线程中运行，
+      等待结果时只挂起当前协程，不阻塞 worker 的事件循环，超时判断也能照常生效
+    - sync/gthread worker 和开发服务器：按 LOGIN_HASH_EXECUTOR 使用线程池或进程池，
+      使用进程池时哈希计算在独立进程中运行，不与请求处理争用 CPU 和 GIL
+    """
+    pid = os.getpid()
+    with _login_pool_lock:
+        owner, pool = current_app.extensions.get('login_pool', (None, None))
+        if owner != pid:
+            workers = current_app.config['LOGIN_HASH_WORKERS']
+            if _threading_patched():
+                from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+                pool = NativeThreadPoolExecutor(max_workers=workers)
+            elif current_app.config['LOGIN_HASH_EXECUTOR'] == 'process':
+                pool = ProcessPoolExecutor(max_workers=workers)
+            else:
+                pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='login')
+            current_app.extensions['login_pool'] = (pid, pool)
+    return pool
+
+
+def _threading_patched():
+    """gevent 是否已对 threading 打补丁（gunicorn 的 gevent worker 中为 True）"""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+def init_db(app):
+    """创建数据库表和默认管理员"""
+    db.create_all()
+    create_default_admin(app)
+
+
 def create_default_admin(app):
     """创建默认超级管理员"""
     from app.models import User
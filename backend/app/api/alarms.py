@@ -4,6 +4,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
 from datetime import datetime
+from app.utils import search_condition, keyset_paginate, station_name_map
+from app.models import Station, AlarmLog
 
 alarm_bp = Blueprint('alarms', __name__)
 
@@ -12,8 +14,6 @@ alarm_bp = Blueprint('alarms', __name__)
 @jwt_required()
 def get_alarms():
     """获取报警日志列表"""
-    from app.models import AlarmLog, Station
-    
     # 筛选参数
     station_id = request.args.get('station_id', type=int)
     alarm_type = request.args.get('alarm_type')  # alarm / cancel
@@ -54,21 +54,37 @@ def get_alarms():
     
     # 搜索（加油站名称或 IMEI）
     if search:
-        query = query.filter(
-            (Station.name.like(f'%{search}%')) |
-            (AlarmLog.indoor_imei.like(f'%{search}%'))
-        )
+        query = query.filter(search_condition([Station.name, AlarmLog.indoor_imei], search))
+    
+    # 游标分页：传入 cursor 参数（第一页为空）时按 (created_at, id) 定位，不统计总数
+    if 'cursor' in request.args:
+        try:
+            items, next_cursor = keyset_paginate(query, AlarmLog, request.args['cursor'], per_page)
+        except ValueError:
+            return jsonify({'code': 400, 'message': '无效的分页游标或每页条数', 'data': None}), 400
+        
+        names = station_name_map(items)
+        return jsonify({
+            'code': 200,
+            'message': '获取成功',
+            'data': {
+                'items': [alarm.to_dict(names) for alarm in items],
+                'per_page': per_page,
+                'next_cursor': next_cursor
+            }
+        })
     
     # 按时间倒序分页
     pagination = query.order_by(AlarmLog.created_at.desc()).paginate(
         page=page, per_page=per_page, error_out=False
     )
     
+    names = station_name_map(pagination.items)
     return jsonify({
         'code': 200,
         'message': '获取成功',
         'data': {
-            'items': [alarm.to_dict() for alarm in pagination.items],
+            'items': [alarm.to_dict(names) for alarm in pagination.items],
             'total': pagination.total,
             'page': page,
             'per_page': per_page,
@@ -1,8 +1,13 @@
 """
 认证 API
 """
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from concurrent.futures import TimeoutError
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import create_access_token, jwt_required
+from app.auth_hash import dummy_hash, verify_password, needs_rehash
+from app import db, login_pool
+from app.utils import current_user
+from app.models import User
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -10,8 +15,6 @@ auth_bp = Blueprint('auth', __name__)
 @auth_bp.route('/login', methods=['POST'])
 def login():
     """用户登录"""
-    from app.models import User
-    
     data = request.get_json()
     if not data:
         return jsonify({'code': 400, 'message': '请求数据为空', 'data': None}), 400
@@ -24,12 +27,28 @@ def login():
     
     user = User.query.filter_by(username=username).first()
     
-    if not user or not user.check_password(password):
+    # 用户不存在时也做一次哈希比对，避免通过响应时间判断用户名是否存在
+    password_hash = user.password_hash if user else dummy_hash()
+    
+    # 哈希计算交给有界执行器（gevent worker 下为原生线程池），登录洪泛时排队超时直接拒绝
+    future = login_pool().submit(verify_password, password_hash, password)
+    try:
+        password_ok = future.result(timeout=current_app.config['LOGIN_HASH_TIMEOUT'])
+    except TimeoutError:
+        future.cancel()
+        return jsonify({'code': 503, 'message': '登录请求过多，请稍后重试', 'data': None}), 503
+    
+    if not user or not password_ok:
         return jsonify({'code': 401, 'message': '用户名或密码错误', 'data': None}), 401
     
     if user.status != 1:
         return jsonify({'code': 403, 'message': '账号已被禁用', 'data': None}), 403
     
+    # 旧算法或旧参数的哈希在登录成功时按当前配置重新生成
+    if needs_rehash(user.password_hash):
+        user.set_password(password)
+        db.session.commit()
+    
     # 生成 JWT Token
     access_token = create_access_token(identity=user.id)
     
@@ -59,10 +78,7 @@ def logout():
 @jwt_required()
 def get_current_user():
     """获取当前用户信息"""
-    from app.models import User
-    
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_user()
     
     if not user:
         return jsonify({'code': 404, 'message': '用户不存在', 'data': None}), 404
@@ -4,6 +4,7 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
 from app.models import CommLog
+from app.utils import keyset_paginate, like_pattern, station_name_map
 
 bp = Blueprint('comm_logs', __name__)
 
@@ -23,26 +24,46 @@ def get_comm_logs():
     
     query = CommLog.query
     
-    if direction:
+    if direction in ['receive', 'forward']:
         query = query.filter(CommLog.direction == direction)
-    if source_type:
+    if source_type in ['indoor', 'outdoor']:
         query = query.filter(CommLog.source_type == source_type)
     if source_imei:
-        query = query.filter(CommLog.source_imei.like(f'%{source_imei}%'))
+        query = query.filter(CommLog.source_imei.like(like_pattern(source_imei), escape='\\'))
     if station_id:
         query = query.filter(CommLog.station_id == station_id)
     
+    # 游标分页：传入 cursor 参数（第一页为空）时按 (created_at, id) 定位，不统计总数
+    if 'cursor' in request.args:
+        try:
+            items, next_cursor = keyset_paginate(query, CommLog, request.args['cursor'], per_page)
+        except ValueError:
+            return jsonify({'code': 400, 'message': '无效的分页游标或每页条数', 'data': None}), 400
+        
+        names = station_name_map(items)
+        return jsonify({
+            'code': 0,
+            'message': 'success',
+            'data': {
+                'items': [log.to_dict(names) for log in items],
+                'per_page': per_page,
+                'next_cursor': next_cursor
+            }
+        })
+    
     # 按时间倒序
     query = query.order_by(CommLog.created_at.desc())
     
     # 分页
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     
+    # 整页已在内存中，直接序列化，由 Flask-Compress 按需压缩（通讯记录的 payload 较大，压缩收益明显）
+    names = station_name_map(pagination.items)
     return jsonify({
         'code': 0,
         'message': 'success',
         'data': {
-            'items': [log.to_dict() for log in pagination.items],
+            'items': [log.to_dict(names) for log in pagination.items],
             'total': pagination.total,
             'page': page,
             'per_page': per_page,
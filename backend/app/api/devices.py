@@ -1,10 +1,14 @@
 """
 设备管理 API
 """
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, g
 from flask_jwt_extended import jwt_required
-from datetime import datetime, timedelta
+from sqlalchemy import and_, not_
+from sqlalchemy.orm import aliased
 from app.api.users import admin_required
+from app.utils import search_condition, station_name_map
+from app import db
+from app.models import Station, Device
 
 device_bp = Blueprint('devices', __name__)
 
@@ -13,8 +17,6 @@ device_bp = Blueprint('devices', __name__)
 @jwt_required()
 def get_devices():
     """获取设备列表"""
-    from app.models import Device, Station
-    
     # 筛选参数
     device_type = request.args.get('type')  # indoor / outdoor
     online = request.args.get('online')  # 1 / 0
@@ -25,7 +27,16 @@ def get_devices():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     
-    query = Device.query
+    # 在线状态、低电量作为 SQL 表达式计算
+    offline_threshold = g.offline_threshold
+    online_cond = and_(Device.last_seen.isnot(None), Device.last_seen > offline_threshold)
+    low_battery_cond = and_(Device.vbat.isnot(None), Device.vbat < 3300)
+    
+    query = db.session.query(
+        Device,
+        online_cond.label('online'),
+        low_battery_cond.label('low_battery')
+    )
     
     # 类型筛选
     if device_type in ['indoor', 'outdoor']:
@@ -35,11 +46,14 @@ def get_devices():
     if station_id:
         query = query.filter(Device.station_id == station_id)
     
+    # 在线状态筛选（在分页前过滤，保证 total 与分页一致）
+    if online is not None:
+        query = query.filter(online_cond if online == '1' else not_(online_cond))
+    
     # 搜索（IMEI 或加油站名称）
     if search:
-        query = query.outerjoin(Station).filter(
-            (Device.imei.like(f'%{search}%')) |
-            (Station.name.like(f'%{search}%'))
+        query = query.outerjoin(Station, Device.station_id == Station.id).filter(
+            search_condition([Device.imei, Station.name], search)
         )
     
     # 分页
@@ -47,26 +61,15 @@ def get_devices():
         page=page, per_page=per_page, error_out=False
     )
     
-    # 计算在线状态
-    offline_threshold = datetime.now() - timedelta(hours=current_app.config['DEVICE_OFFLINE_HOURS'])
-    
+    names = station_name_map([device for device, _, _ in pagination.items])
     devices = []
-    for device in pagination.items:
-        device_dict = device.to_dict()
-        # 计算在线状态
-        if device.last_seen and device.last_seen > offline_threshold:
-            device_dict['online'] = True
-        else:
-            device_dict['online'] = False
+    for device, is_online, low_battery in pagination.items:
+        device_dict = device.to_dict(names)
+        device_dict['online'] = bool(is_online)
         # 低电量警告
-        device_dict['low_battery'] = device.vbat is not None and device.vbat < 3300
+        device_dict['low_battery'] = bool(low_battery)
         devices.append(device_dict)
     
-    # 在线状态筛选（在内存中筛选，因为是计算字段）
-    if online is not None:
-        online_bool = online == '1'
-        devices = [d for d in devices if d['online'] == online_bool]
-    
     return jsonify({
         'code': 200,
         'message': '获取成功',
@@ -84,9 +87,6 @@ def get_devices():
 @admin_required
 def create_device():
     """手动添加设备"""
-    from app.models import Device
-    from app import db
-    
     data = request.get_json()
     if not data:
         return jsonify({'code': 400, 'message': '请求数据为空', 'data': None}), 400
@@ -126,14 +126,12 @@ def create_device():
 @jwt_required()
 def get_device(imei):
     """获取设备详情"""
-    from app.models import Device
-    
     device = Device.query.filter_by(imei=imei).first()
     if not device:
         return jsonify({'code': 404, 'message': '设备不存在', 'data': None}), 404
     
     # 计算在线状态
-    offline_threshold = datetime.now() - timedelta(hours=current_app.config['DEVICE_OFFLINE_HOURS'])
+    offline_threshold = g.offline_threshold
     device_dict = device.to_dict()
     device_dict['online'] = device.last_seen and device.last_seen > offline_threshold
     device_dict['low_battery'] = device.vbat is not None and device.vbat < 3300
@@ -149,31 +147,50 @@ def get_device(imei):
 @admin_required
 def bind_device(imei):
     """绑定设备到加油站"""
-    from app.models import Device, Station
-    from app import db
-    
-    device = Device.query.filter_by(imei=imei).first()
-    if not device:
+    data = request.get_json()
+    station_id = data.get('station_id') if data else None
+    
+    # 一次查询取回设备、当前绑定的加油站名称、目标加油站、目标加油站已绑定的其他室内机
+    current_station = aliased(Station)
+    target_station = aliased(Station)
+    existing_indoor = aliased(Device)
+    row = db.session.execute(
+        db.select(
+            Device,
+            current_station.name,
+            target_station,
+            existing_indoor.imei
+        ).outerjoin(
+            current_station, Device.station_id == current_station.id
+        ).outerjoin(
+            target_station, target_station.id == station_id
+        ).outerjoin(
+            existing_indoor, and_(
+                existing_indoor.station_id == station_id,
+                existing_indoor.type == 'indoor',
+                existing_indoor.id != Device.id
+            )
+        ).where(Device.imei == imei)
+    ).first()
+    
+    if not row:
         return jsonify({'code': 404, 'message': '设备不存在', 'data': None}), 404
     
-    data = request.get_json()
+    device, bound_station_name, station, existing_indoor_imei = row
+    
     if not data or 'station_id' not in data:
         return jsonify({'code': 400, 'message': '请指定加油站ID', 'data': None}), 400
     
-    station_id = data['station_id']
     expected_type = data.get('expected_type')  # 期望的设备类型
     
-    station = Station.query.get(station_id)
     if not station:
         return jsonify({'code': 404, 'message': '加油站不存在', 'data': None}), 404
     
     # 检查设备是否已被其他加油站绑定
     if device.station_id and device.station_id != station_id:
-        bound_station = Station.query.get(device.station_id)
-        bound_station_name = bound_station.name if bound_station else '未知加油站'
         return jsonify({
             'code': 409,
-            'message': f'该设备已被【{bound_station_name}】绑定，无法再次绑定',
+            'message': f'该设备已被【{bound_station_name or "未知加油站"}】绑定，无法再次绑定',
             'data': None
         }), 409
     
@@ -188,18 +205,14 @@ def bind_device(imei):
         }), 409
     
     # 室内机绑定检查：每个加油站只能有一个室内机
-    if device.type == 'indoor':
-        existing_indoor = Device.query.filter_by(
-            station_id=station_id, type='indoor'
-        ).first()
-        if existing_indoor and existing_indoor.imei != imei:
-            return jsonify({
-                'code': 409,
-                'message': f'该加油站已绑定室内机 {existing_indoor.imei}',
-                'data': None
-            }), 409
-    
-    device.station_id = station_id
+    if device.type == 'indoor' and existing_indoor_imei:
+        return jsonify({
+            'code': 409,
+            'message': f'该加油站已绑定室内机 {existing_indoor_imei}',
+            'data': None
+        }), 409
+    
+    device.station = station
     db.session.commit()
     
     return jsonify({
@@ -213,9 +226,6 @@ def bind_device(imei):
 @admin_required
 def unbind_device(imei):
     """解绑设备"""
-    from app.models import Device
-    from app import db
-    
     device = Device.query.filter_by(imei=imei).first()
     if not device:
         return jsonify({'code': 404, 'message': '设备不存在', 'data': None}), 404
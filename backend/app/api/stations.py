@@ -1,10 +1,13 @@
 """
 加油站管理 API
 """
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, g
 from flask_jwt_extended import jwt_required
-from datetime import datetime, timedelta
+from sqlalchemy import func, case
 from app.api.users import admin_required
+from app.utils import search_condition
+from app import db
+from app.models import Station, Device, AlarmLog, format_datetime
 
 station_bp = Blueprint('stations', __name__)
 
@@ -13,22 +16,44 @@ station_bp = Blueprint('stations', __name__)
 @jwt_required()
 def get_stats():
     """获取平台统计数据"""
-    from app.models import Station, Device, AlarmLog
-    
-    # 加油站总数
-    station_count = Station.query.count()
-    
-    # 设备总数
-    device_count = Device.query.count()
-    
     # 在线设备数（last_seen 在 13 小时内）
-    offline_threshold = datetime.now() - timedelta(hours=current_app.config['DEVICE_OFFLINE_HOURS'])
-    online_count = Device.query.filter(Device.last_seen > offline_threshold).count()
-    
-    # 最近报警记录（最近10条）
-    recent_alarms = AlarmLog.query.join(
-        Station, AlarmLog.station_id == Station.id, isouter=True
-    ).order_by(AlarmLog.created_at.desc()).limit(10).all()
+    offline_threshold = g.offline_threshold
+    
+    # 加油站总数、设备总数、在线设备数合并为一次查询
+    station_count, device_count, online_count = db.session.execute(
+        db.select(
+            db.select(func.count(Station.id)).scalar_subquery(),
+            func.count(Device.id),
+            func.count(case((Device.last_seen > offline_threshold, 1)))
+        ).select_from(Device)
+    ).one()
+    
+    # 最近报警记录（最近10条），只查询需要的列，不构造 ORM 对象
+    rows = db.session.execute(
+        db.select(
+            AlarmLog.id,
+            AlarmLog.station_id,
+            Station.name.label('station_name'),
+            AlarmLog.indoor_imei,
+            AlarmLog.alarm_type,
+            AlarmLog.outdoor_imeis,
+            AlarmLog.forward_status,
+            AlarmLog.created_at
+        ).join(
+            Station, AlarmLog.station_id == Station.id, isouter=True
+        ).order_by(AlarmLog.created_at.desc()).limit(10)
+    ).all()
+    
+    recent_alarms = [{
+        'id': row.id,
+        'station_id': row.station_id,
+        'station_name': row.station_name,
+        'indoor_imei': row.indoor_imei,
+        'alarm_type': row.alarm_type,
+        'outdoor_imeis': row.outdoor_imeis or [],
+        'forward_status': row.forward_status,
+        'created_at': format_datetime(row.created_at)
+    } for row in rows]
     
     return jsonify({
         'code': 200,
@@ -37,7 +62,7 @@ def get_stats():
             'station_count': station_count,
             'device_count': device_count,
             'online_count': online_count,
-            'recent_alarms': [alarm.to_dict() for alarm in recent_alarms]
+            'recent_alarms': recent_alarms
         }
     })
 
@@ -46,8 +71,6 @@ def get_stats():
 @jwt_required()
 def get_stations():
     """获取加油站列表"""
-    from app.models import Station
-    
     # 分页参数
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
@@ -59,10 +82,7 @@ def get_stations():
     
     # 搜索过滤
     if search:
-        query = query.filter(
-            (Station.name.like(f'%{search}%')) |
-            (Station.code.like(f'%{search}%'))
-        )
+        query = query.filter(search_condition([Station.name, Station.code], search))
     
     # 分页
     pagination = query.order_by(Station.created_at.desc()).paginate(
@@ -86,22 +106,22 @@ def get_stations():
 @jwt_required()
 def get_station(station_id):
     """获取加油站详情"""
-    from app.models import Station, Device
-    
     station = Station.query.get(station_id)
     if not station:
         return jsonify({'code': 404, 'message': '加油站不存在', 'data': None}), 404
     
     # 计算在线阈值
-    offline_threshold = datetime.now() - timedelta(hours=current_app.config['DEVICE_OFFLINE_HOURS'])
+    offline_threshold = g.offline_threshold
     
-    # 获取绑定的设备
-    devices = Device.query.filter_by(station_id=station_id).all()
+    # 获取绑定的设备，按批读取
+    devices = Device.query.filter_by(station_id=station_id).yield_per(200)
     indoor_device = None
     outdoor_devices = []
     
+    # 设备都属于同一加油站，直接用已查询的名称
+    names = {station.id: station.name}
     for device in devices:
-        device_dict = device.to_dict()
+        device_dict = device.to_dict(names)
         # 计算在线状态
         device_dict['online'] = device.last_seen and device.last_seen > offline_threshold
         
@@ -125,9 +145,6 @@ def get_station(station_id):
 @jwt_required()
 def create_station():
     """创建加油站"""
-    from app.models import Station
-    from app import db
-    
     data = request.get_json()
     if not data:
         return jsonify({'code': 400, 'message': '请求数据为空', 'data': None}), 400
@@ -165,9 +182,6 @@ def create_station():
 @jwt_required()
 def update_station(station_id):
     """更新加油站"""
-    from app.models import Station
-    from app import db
-    
     station = Station.query.get(station_id)
     if not station:
         return jsonify({'code': 404, 'message': '加油站不存在', 'data': None}), 404
@@ -206,9 +220,6 @@ def update_station(station_id):
 @jwt_required()
 def delete_station(station_id):
     """删除加油站"""
-    from app.models import Station, Device
-    from app import db
-    
     station = Station.query.get(station_id)
     if not station:
         return jsonify({'code': 404, 'message': '加油站不存在', 'data': None}), 404
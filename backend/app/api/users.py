@@ -2,8 +2,11 @@
 用户管理 API
 """
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from functools import wraps
+from app.utils import current_user, stream_array_response
+from app import db
+from app.models import User, format_datetime
 
 user_bp = Blueprint('users', __name__)
 
@@ -13,10 +16,8 @@ def admin_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        from app.models import User
-        
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        # 加载的用户缓存在 g 上，处理函数可通过 current_user() 复用
+        user = current_user()
         
         if not user or user.role != 'admin':
             return jsonify({'code': 403, 'message': '需要管理员权限', 'data': None}), 403
@@ -29,13 +30,25 @@ def admin_required(fn):
 @admin_required
 def get_users():
     """获取用户列表"""
-    from app.models import User
-    
-    users = User.query.all()
-    return jsonify({
-        'code': 200,
-        'message': '获取成功',
-        'data': [user.to_dict() for user in users]
+    # 只查询需要的列，不构造 ORM 对象；按批读取并逐条输出，用户表再大也不会一次性载入内存
+    rows = db.session.execute(
+        db.select(
+            User.id,
+            User.username,
+            User.role,
+            User.status,
+            User.created_at,
+            User.updated_at
+        ).execution_options(yield_per=500)
+    )
+    
+    return stream_array_response(rows, lambda row: {
+        'id': row.id,
+        'username': row.username,
+        'role': row.role,
+        'status': row.status,
+        'created_at': format_datetime(row.created_at),
+        'updated_at': format_datetime(row.updated_at)
     })
 
 
@@ -43,9 +56,6 @@ def get_users():
 @admin_required
 def create_user():
     """创建用户"""
-    from app.models import User
-    from app import db
-    
     data = request.get_json()
     if not data:
         return jsonify({'code': 400, 'message': '请求数据为空', 'data': None}), 400
@@ -81,9 +91,6 @@ def create_user():
 @admin_required
 def update_user(user_id):
     """更新用户"""
-    from app.models import User
-    from app import db
-    
     user = User.query.get(user_id)
     if not user:
         return jsonify({'code': 404, 'message': '用户不存在', 'data': None}), 404
@@ -125,16 +132,12 @@ def update_user(user_id):
 @admin_required
 def delete_user(user_id):
     """删除用户"""
-    from app.models import User
-    from app import db
-    
     user = User.query.get(user_id)
     if not user:
         return jsonify({'code': 404, 'message': '用户不存在', 'data': None}), 404
     
     # 不能删除自己
-    current_user_id = get_jwt_identity()
-    if user_id == current_user_id:
+    if user.id == current_user().id:
         return jsonify({'code': 400, 'message': '不能删除自己', 'data': None}), 400
     
     db.session.delete(user)
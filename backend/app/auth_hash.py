@@ -0,0 +1,64 @@
+"""
+密码哈希
+
+新密码默认使用 argon2id（PASSWORD_HASH_SCHEME = 'bcrypt' 时改用 bcrypt），
+校验时按哈希前缀兼容两种算法；弱于当前配置的哈希在登录成功后自动升级，不会降级。
+"""
+import bcrypt
+from flask import current_app
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+
+_argon2 = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
+
+# 用户不存在时用于比对的哈希，按 (算法, bcrypt 成本) 缓存，首次使用时生成
+_dummy_hashes = {}
+
+
+def hash_password(password):
+    """按当前配置生成密码哈希"""
+    if current_app.config['PASSWORD_HASH_SCHEME'] == 'bcrypt':
+        salt = bcrypt.gensalt(rounds=current_app.config['BCRYPT_COST'])
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+    return _argon2.hash(password)
+
+
+def dummy_hash():
+    """用户不存在时用于比对的哈希
+    
+    按当前配置生成，使其校验耗时与真实用户的哈希一致，两种失败路径无法通过响应时间区分。
+    """
+    key = (current_app.config['PASSWORD_HASH_SCHEME'], current_app.config['BCRYPT_COST'])
+    password_hash = _dummy_hashes.get(key)
+    if password_hash is None:
+        password_hash = _dummy_hashes[key] = hash_password('dummy-password')
+    return password_hash
+
+
+def needs_rehash(password_hash):
+    """哈希需要按当前配置升级时返回 True
+    
+    只升级不降级：bcrypt 哈希在配置为 argon2 时升级为 argon2，成本低于 BCRYPT_COST 时按当前成本重新生成；
+    配置为 bcrypt 时不替换已有的 argon2 哈希，也不降低 bcrypt 成本。
+    """
+    if password_hash.startswith('$argon2'):
+        if current_app.config['PASSWORD_HASH_SCHEME'] == 'bcrypt':
+            return False
+        return _argon2.check_needs_rehash(password_hash)
+    if current_app.config['PASSWORD_HASH_SCHEME'] != 'bcrypt':
+        return True
+    # bcrypt 哈希格式：$2b$<cost>$<salt+hash>
+    return int(password_hash.split('$')[2]) < current_app.config['BCRYPT_COST']
+
+
+def verify_password(password_hash, password):
+    """校验密码，按哈希前缀区分 argon2 / bcrypt"""
+    if password_hash.startswith('$argon2'):
+        try:
+            return _argon2.verify(password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    return bcrypt.checkpw(
+        password.encode('utf-8'),
+        password_hash.encode('utf-8')
+    )
@@ -2,9 +2,83 @@
 数据模型定义
 """
 from datetime import datetime
+from enum import IntEnum
 from app import db
-import bcrypt
-import json
+from app.auth_hash import hash_password, verify_password
+
+
+def format_datetime(dt):
+    """格式化为 'YYYY-MM-DD HH:MM:SS'，比 strftime 快；None 原样返回"""
+    if dt is None:
+        return None
+    return f'{dt.year:04d}-{dt.month:02d}-{dt.day:02d} {dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}'
+
+
+class UserRole(IntEnum):
+    """用户角色"""
+    ADMIN = 1
+    USER = 2
+
+
+class DeviceType(IntEnum):
+    """设备类型"""
+    INDOOR = 1
+    OUTDOOR = 2
+
+
+class AlarmType(IntEnum):
+    """报警类型"""
+    ALARM = 1
+    CANCEL = 2
+
+
+class Direction(IntEnum):
+    """通讯方向"""
+    RECEIVE = 1
+    FORWARD = 2
+
+
+class IntEnumType(db.TypeDecorator):
+    """以 SMALLINT 存储的枚举列，Python 侧仍读写小写字符串（如 'indoor'）
+    
+    枚举值与原 MySQL ENUM 的序号一致（从 1 开始），原 ENUM 列可直接 MODIFY 为 SMALLINT。
+    """
+    impl = db.SmallInteger
+    cache_ok = True
+    
+    class comparator_factory(db.TypeDecorator.Comparator):
+        """枚举列不支持下标运算
+        
+        SQLAlchemy 解析 Flask-SQLAlchemy 中 type[Query] 形式的注解时在模型类的命名空间里求值，
+        Device.type 列会遮蔽内置的 type；这里直接报错，SQLAlchemy 会把该注解视为与映射无关而跳过。
+        """
+        
+        def __getitem__(self, index):
+            raise TypeError('枚举列不支持下标运算')
+    
+    def __init__(self, enum_class):
+        super().__init__()
+        self.enum_class = enum_class
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return int(self.enum_class[value.upper()] if isinstance(value, str) else self.enum_class(value))
+        except (KeyError, ValueError):
+            raise ValueError(f'无效的{self.enum_class.__doc__}: {value}')
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self.enum_class(value).name.lower()
+
+
+def station_name(obj, station_name_map=None):
+    """获取记录所属加油站名称，优先从 station_name_map 中查找"""
+    if station_name_map is not None:
+        return station_name_map.get(obj.station_id)
+    return obj.station.name if obj.station else None
 
 
 # 用户-加油站关联表
@@ -23,7 +97,7 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     username = db.Column(db.String(50), unique=True, nullable=False, comment='用户名')
     password_hash = db.Column(db.String(255), nullable=False, comment='密码哈希')
-    role = db.Column(db.Enum('admin', 'user'), default='user', comment='角色')
+    role = db.Column(IntEnumType(UserRole), default='user', comment='角色：1管理员，2普通用户')
     status = db.Column(db.SmallInteger, default=1, comment='状态：1启用，0禁用')
     created_at = db.Column(db.DateTime, default=datetime.now, comment='创建时间')
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
@@ -33,17 +107,11 @@ class User(db.Model):
     
     def set_password(self, password):
         """设置密码"""
-        self.password_hash = bcrypt.hashpw(
-            password.encode('utf-8'),
-            bcrypt.gensalt()
-        ).decode('utf-8')
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         """验证密码"""
-        return bcrypt.checkpw(
-            password.encode('utf-8'),
-            self.password_hash.encode('utf-8')
-        )
+        return verify_password(self.password_hash, password)
     
     def to_dict(self):
         """转换为字典"""
@@ -52,14 +120,18 @@ class User(db.Model):
             'username': self.username,
             'role': self.role,
             'status': self.status,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
-            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
+            'created_at': format_datetime(self.created_at),
+            'updated_at': format_datetime(self.updated_at)
         }
 
 
 class Station(db.Model):
     """加油站模型"""
     __tablename__ = 'stations'
+    __table_args__ = (
+        db.Index('ft_stations_name', 'name', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+        db.Index('ft_stations_code', 'code', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(100), nullable=False, comment='加油站名称')
@@ -71,8 +143,9 @@ class Station(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now, comment='创建时间')
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
     
-    # 关联的设备
-    devices = db.relationship('Device', backref='station', lazy='select')
+    # 关联的设备：禁止隐式懒加载，避免列表接口中出现 N+1 查询；需要时显式查询 Device
+    # 删除前接口已确认无绑定设备，passive_deletes 使删除时不加载该集合
+    devices = db.relationship('Device', backref='station', lazy='raise', passive_deletes=True)
     
     def to_dict(self, include_device_count=True):
         """转换为字典"""
@@ -84,13 +157,12 @@ class Station(db.Model):
             'contact': self.contact,
             'phone': self.phone,
             'status': self.status,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
-            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
+            'created_at': format_datetime(self.created_at),
+            'updated_at': format_datetime(self.updated_at)
         }
         
         # 包含设备数量统计
         if include_device_count:
-            from app.models import Device
             indoor_count = Device.query.filter_by(station_id=self.id, type='indoor').count()
             outdoor_count = Device.query.filter_by(station_id=self.id, type='outdoor').count()
             result['indoor_count'] = indoor_count
@@ -103,10 +175,16 @@ class Station(db.Model):
 class Device(db.Model):
     """设备模型"""
     __tablename__ = 'devices'
+    __table_args__ = (
+        db.Index('ix_devices_last_seen', 'last_seen'),
+        db.Index('ix_devices_type_last_seen', 'type', 'last_seen'),
+        db.Index('ix_devices_type_station_last_seen', 'type', 'station_id', 'last_seen'),
+        db.Index('ft_devices_imei', 'imei', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     imei = db.Column(db.String(20), unique=True, nullable=False, comment='IMEI')
-    type = db.Column(db.Enum('indoor', 'outdoor'), nullable=False, comment='设备类型')
+    type = db.Column(IntEnumType(DeviceType), nullable=False, comment='设备类型：1室内机，2室外机')
     name = db.Column(db.String(100), default='', comment='设备名称/备注')
     station_id = db.Column(db.Integer, db.ForeignKey('stations.id'), nullable=True, comment='绑定的加油站ID')
     last_seen = db.Column(db.DateTime, nullable=True, comment='最后在线时间')
@@ -114,75 +192,82 @@ class Device(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now, comment='创建时间')
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
     
-    def to_dict(self):
-        """转换为字典"""
+    def to_dict(self, station_name_map=None):
+        """转换为字典
+        
+        列表接口传入预先批量查询的 station_name_map（{加油站ID: 名称}），避免逐条加载加油站。
+        """
         return {
             'id': self.id,
             'imei': self.imei,
             'type': self.type,
             'name': self.name,
             'station_id': self.station_id,
-            'station_name': self.station.name if self.station else None,
-            'last_seen': self.last_seen.strftime('%Y-%m-%d %H:%M:%S') if self.last_seen else None,
+            'station_name': station_name(self, station_name_map),
+            'last_seen': format_datetime(self.last_seen),
             'vbat': self.vbat,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
-            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
+            'created_at': format_datetime(self.created_at),
+            'updated_at': format_datetime(self.updated_at)
         }
 
 
 class AlarmLog(db.Model):
     """报警日志模型"""
     __tablename__ = 'alarm_logs'
+    __table_args__ = (
+        db.Index('ft_alarm_logs_indoor_imei', 'indoor_imei', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+        db.Index('ix_alarm_logs_created_id', 'created_at', 'id'),
+        db.Index('ix_alarm_logs_station_created', 'station_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     station_id = db.Column(db.Integer, db.ForeignKey('stations.id'), nullable=True, comment='加油站ID')
     indoor_imei = db.Column(db.String(20), nullable=False, comment='室内机IMEI')
-    alarm_type = db.Column(db.Enum('alarm', 'cancel'), nullable=False, comment='报警类型')
-    outdoor_imeis = db.Column(db.Text, default='[]', comment='转发的室外机IMEI列表（JSON数组）')
+    alarm_type = db.Column(IntEnumType(AlarmType), nullable=False, comment='报警类型：1报警，2取消')
+    outdoor_imeis = db.Column(db.JSON, default=list, comment='转发的室外机IMEI列表')
     forward_status = db.Column(db.SmallInteger, default=1, comment='转发状态：1成功，0失败')
     created_at = db.Column(db.DateTime, default=datetime.now, comment='创建时间')
     
-    # 关联加油站
-    station = db.relationship('Station', backref='alarm_logs')
+    # 关联加油站：禁止隐式懒加载，序列化时使用 station_name_map
+    station = db.relationship('Station', backref='alarm_logs', lazy='raise')
     
-    def to_dict(self):
+    def to_dict(self, station_name_map=None):
         """转换为字典"""
-        try:
-            outdoor_list = json.loads(self.outdoor_imeis) if self.outdoor_imeis else []
-        except:
-            outdoor_list = []
-        
         return {
             'id': self.id,
             'station_id': self.station_id,
-            'station_name': self.station.name if self.station else None,
+            'station_name': station_name(self, station_name_map),
             'indoor_imei': self.indoor_imei,
             'alarm_type': self.alarm_type,
-            'outdoor_imeis': outdoor_list,
+            'outdoor_imeis': self.outdoor_imeis or [],
             'forward_status': self.forward_status,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None
+            'created_at': format_datetime(self.created_at)
         }
 
 
 class CommLog(db.Model):
     """通讯记录模型"""
     __tablename__ = 'comm_logs'
+    __table_args__ = (
+        db.Index('ix_comm_logs_created_id', 'created_at', 'id'),
+        db.Index('ix_comm_logs_station_created', 'station_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    direction = db.Column(db.Enum('receive', 'forward'), nullable=False, comment='方向：receive接收，forward转发')
-    source_type = db.Column(db.Enum('indoor', 'outdoor'), nullable=False, comment='来源设备类型')
+    direction = db.Column(IntEnumType(Direction), nullable=False, comment='方向：1接收，2转发')
+    source_type = db.Column(IntEnumType(DeviceType), nullable=False, comment='来源设备类型：1室内机，2室外机')
     source_imei = db.Column(db.String(20), nullable=False, comment='来源设备IMEI')
-    target_type = db.Column(db.Enum('indoor', 'outdoor'), nullable=True, comment='目标设备类型')
+    target_type = db.Column(IntEnumType(DeviceType), nullable=True, comment='目标设备类型：1室内机，2室外机')
     target_imei = db.Column(db.String(20), nullable=True, comment='目标设备IMEI')
     topic = db.Column(db.String(100), nullable=False, comment='MQTT主题')
     payload = db.Column(db.Text, nullable=False, comment='原始数据')
     station_id = db.Column(db.Integer, db.ForeignKey('stations.id'), nullable=True, comment='加油站ID')
     created_at = db.Column(db.DateTime, default=datetime.now, comment='创建时间')
     
-    # 关联加油站
-    station = db.relationship('Station', backref='comm_logs')
+    # 关联加油站：禁止隐式懒加载，序列化时使用 station_name_map
+    station = db.relationship('Station', backref='comm_logs', lazy='raise')
     
-    def to_dict(self):
+    def to_dict(self, station_name_map=None):
         """转换为字典"""
         return {
             'id': self.id,
@@ -194,6 +279,6 @@ class CommLog(db.Model):
             'topic': self.topic,
             'payload': self.payload,
             'station_id': self.station_id,
-            'station_name': self.station.name if self.station else None,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None
+            'station_name': station_name(self, station_name_map),
+            'created_at': format_datetime(self.created_at)
         }
@@ -1,17 +1,80 @@
 """
 MQTT 转发服务
 """
-import json
+import atexit
+import logging
+import queue
 import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
+import orjson
 import paho.mqtt.client as mqtt
+from cachetools import TTLCache
+from sqlalchemy import bindparam
+from app import db
+from app.models import Device, AlarmLog, CommLog
 
 
+# 日志经队列交给后台线程输出，消息处理线程不直接做 I/O；
+# 逐条消息的日志为 DEBUG 级别，生产环境按 INFO 运行时不会格式化
+logger = logging.getLogger('mqtt')
+
 # 全局 MQTT 客户端
 mqtt_client = None
 flask_app = None
 _mqtt_started = False  # 防止重复启动标志
 
+# 按订阅主题注册的消息回调：((Topic 过滤器, 回调), ...)，启动时从配置构建一次。
+# 由 paho 按过滤器匹配后直接调用对应回调，回调中只需按前缀长度切片取 IMEI
+_topic_callbacks = ()
+
+# 消息处理队列：网络线程只负责入队，数据库读写在处理线程中完成，避免慢查询阻塞 MQTT 收包。
+# 共 MESSAGE_WORKERS 个处理线程，按 Topic 分片到各自的队列，
+# 同一设备的消息总由同一线程处理，保证按到达顺序处理
+MESSAGE_WORKERS = 8
+MESSAGE_QUEUE_SIZE = 10000
+_message_queues = [queue.Queue(maxsize=MESSAGE_QUEUE_SIZE) for _ in range(MESSAGE_WORKERS)]
+
+# 通讯日志写入队列：消息处理线程只入队，由写入线程攒批后一次性插入，
+# 每批最多 COMM_LOG_BATCH_SIZE 条，或等待 COMM_LOG_FLUSH_INTERVAL 秒后写出
+COMM_LOG_QUEUE_SIZE = 100000
+COMM_LOG_BATCH_SIZE = 500
+COMM_LOG_FLUSH_INTERVAL = 0.1
+_comm_log_queue = queue.Queue(maxsize=COMM_LOG_QUEUE_SIZE)
+
+# 设备缓存：按 IMEI 缓存设备信息，按 (加油站ID, 设备类型) 缓存同站设备的 IMEI 和订阅 Topic，
+# 避免每条消息都查询数据库。Web 端的绑定/解绑最多 DEVICE_CACHE_TTL 秒后生效
+DEVICE_CACHE_SIZE = 4096
+DEVICE_CACHE_TTL = 60
+_device_cache = TTLCache(maxsize=DEVICE_CACHE_SIZE, ttl=DEVICE_CACHE_TTL)
+_station_device_cache = TTLCache(maxsize=DEVICE_CACHE_SIZE, ttl=DEVICE_CACHE_TTL)
+_cache_lock = threading.RLock()
+
+# 在线时间与电量写回：处理线程只记录到 _pending_device_state（同一设备只保留最新值），
+# 由写回线程每 DEVICE_STATE_FLUSH_INTERVAL 秒合并为一次批量 UPDATE
+DEVICE_STATE_FLUSH_INTERVAL = 10
+_pending_device_state = {}
+_pending_lock = threading.Lock()
+_device_state_update = (
+    Device.__table__.update()
+    .where(Device.__table__.c.id == bindparam('device_id'))
+    .values(last_seen=bindparam('last_seen'), vbat=bindparam('vbat'))
+)
+
+
+class CachedDevice:
+    """缓存的设备信息，与数据库会话无关"""
+    __slots__ = ('id', 'imei', 'type', 'station_id', 'last_seen', 'vbat')
+    
+    def __init__(self, device):
+        self.id = device.id
+        self.imei = device.imei
+        self.type = device.type
+        self.station_id = device.station_id
+        self.last_seen = device.last_seen
+        self.vbat = device.vbat
+
 
 def start_mqtt_service(app):
     """启动 MQTT 服务"""
@@ -19,11 +82,13 @@ def start_mqtt_service(app):
     
     # 防止重复启动
     if _mqtt_started:
-        print("MQTT 服务已在运行，跳过重复启动")
+        logger.warning("MQTT 服务已在运行，跳过重复启动")
         return
     
     _mqtt_started = True
     flask_app = app
+    _setup_logging(app)
+    load_topic_prefixes(app)
     
     # 使用唯一的 client_id 避免 broker 端的重复连接问题
     import uuid
@@ -34,82 +99,216 @@ def start_mqtt_service(app):
         app.config['MQTT_USERNAME'],
         app.config['MQTT_PASSWORD']
     )
+    mqtt_client.max_inflight_messages_set(app.config['MQTT_MAX_INFLIGHT'])
+    mqtt_client.max_queued_messages_set(app.config['MQTT_MAX_QUEUED'])
+    mqtt_client.reconnect_delay_set(
+        min_delay=app.config['MQTT_RECONNECT_MIN_DELAY'],
+        max_delay=app.config['MQTT_RECONNECT_MAX_DELAY']
+    )
     mqtt_client.on_connect = on_connect
-    mqtt_client.on_message = on_message
     mqtt_client.on_disconnect = on_disconnect
     
-    def connect_mqtt():
+    # 全局唯一客户端，本进程内需要发布消息的代码通过 current_app.extensions['mqtt'] 复用。
+    # 只在运行 MQTT 服务的进程中存在（mqtt_worker.py，开发环境为 app.py）；
+    # gunicorn 的 Web worker 中没有该客户端，也不能把它带入 fork 出的子进程使用：
+    # 子进程中没有网络线程，publish 的消息不会被发送
+    app.extensions['mqtt'] = mqtt_client
+    
+    # 通讯日志写入线程
+    writer_thread = threading.Thread(target=_comm_log_writer, daemon=True)
+    writer_thread.start()
+    # 进程退出前停止写入线程，并写出它手中的批次和队列中剩余的通讯日志
+    atexit.register(stop_comm_log_writer, writer_thread)
+    
+    # 设备状态写回线程
+    state_thread = threading.Thread(target=_device_state_writer, daemon=True)
+    state_thread.start()
+    # 写回线程为守护线程，进程退出时不会等待；退出前把尚未落库的设备状态写出
+    atexit.register(flush_device_state)
+    
+    # 消息处理线程
+    for message_queue in _message_queues:
+        worker_thread = threading.Thread(target=_message_worker, args=(message_queue,), daemon=True)
+        worker_thread.start()
+    
+    # 网络循环运行在 paho 自带的后台线程中，连接失败或断开后按退避间隔自动重连
+    mqtt_client.connect_async(
+        app.config['MQTT_BROKER_HOST'],
+        app.config['MQTT_BROKER_PORT'],
+        app.config['MQTT_KEEPALIVE']
+    )
+    mqtt_client.loop_start()
+    logger.info("MQTT 服务已启动 (client_id: %s)", client_id)
+
+
+def _setup_logging(app):
+    """为 MQTT 日志配置队列处理器和后台输出线程"""
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    # 进程退出时输出队列中剩余的日志（最先注册，在其他退出处理之后执行）
+    atexit.register(listener.stop)
+    
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(app.config['MQTT_LOG_LEVEL'])
+    logger.propagate = False
+
+
+def load_topic_prefixes(app):
+    """根据配置的发布 Topic 前缀构建各订阅主题的消息回调"""
+    global _topic_callbacks
+    _topic_callbacks = tuple(
+        (prefix + '+', _make_topic_callback(len(prefix), handler))
+        for prefix, handler in (
+            (app.config['INDOOR_PUB_PREFIX'], handle_indoor_message),
+            (app.config['OUTDOOR_PUB_PREFIX'], handle_outdoor_message),
+        )
+    )
+
+
+def _make_topic_callback(prefix_len, handler):
+    """生成单个订阅主题的消息回调：切片取 IMEI 后按 Topic 分片入队，不处理"""
+    def on_topic_message(client, userdata, msg):
+        topic = msg.topic
         try:
-            mqtt_client.connect(
-                app.config['MQTT_BROKER_HOST'],
-                app.config['MQTT_BROKER_PORT'],
-                60
+            _message_queues[hash(topic) % MESSAGE_WORKERS].put_nowait(
+                (handler, topic[prefix_len:], msg.payload)
             )
-            mqtt_client.loop_forever()
-        except Exception as e:
-            print(f"MQTT 连接失败: {e}")
+        except queue.Full:
+            logger.warning("消息队列已满，丢弃消息: %s", topic)
     
-    # 在单独线程中运行 MQTT
-    mqtt_thread = threading.Thread(target=connect_mqtt, daemon=True)
-    mqtt_thread.start()
-    print(f"MQTT 服务已启动 (client_id: {client_id})")
+    return on_topic_message
 
 
 def on_connect(client, userdata, flags, rc):
     """MQTT 连接回调"""
     if rc == 0:
-        print("MQTT 连接成功")
-        # 订阅室内机和室外机的发布主题
-        client.subscribe(flask_app.config['INDOOR_PUB_PREFIX'] + '+')
-        client.subscribe(flask_app.config['OUTDOOR_PUB_PREFIX'] + '+')
-        print(f"已订阅: {flask_app.config['INDOOR_PUB_PREFIX']}+")
-        print(f"已订阅: {flask_app.config['OUTDOOR_PUB_PREFIX']}+")
+        logger.info("MQTT 连接成功")
+        # 订阅室内机和室外机的发布主题，并为每个主题注册各自的消息回调
+        for topic_filter, callback in _topic_callbacks:
+            client.subscribe(topic_filter)
+            client.message_callback_add(topic_filter, callback)
+            logger.info("已订阅: %s", topic_filter)
     else:
-        print(f"MQTT 连接失败，返回码: {rc}")
+        logger.error("MQTT 连接失败，返回码: %s", rc)
 
 
 def on_disconnect(client, userdata, rc):
     """MQTT 断开连接回调"""
-    print(f"MQTT 断开连接，返回码: {rc}")
+    logger.warning("MQTT 断开连接，返回码: %s", rc)
+
+
+def _message_worker(message_queue):
+    """消息处理线程"""
+    while True:
+        handler, imei, payload = message_queue.get()
+        dispatch_message(handler, imei, payload)
 
 
-def on_message(client, userdata, msg):
-    """MQTT 消息回调"""
+def log_comm(direction, source_type, source_imei, topic, payload, station_id,
+             target_type=None, target_imei=None):
+    """记录通讯日志（入队，由写入线程批量插入）
+    
+    payload 为原始 bytes，在写入线程中解码。
+    """
     try:
-        topic = msg.topic
-        payload = msg.payload.decode('utf-8')
-        
-        print(f"收到消息: {topic} -> {payload}")
+        # 创建时间在入队时确定，保证与消息到达顺序一致；各条记录字段相同，便于批量插入
+        _comm_log_queue.put_nowait({
+            'direction': direction,
+            'source_type': source_type,
+            'source_imei': source_imei,
+            'target_type': target_type,
+            'target_imei': target_imei,
+            'topic': topic,
+            'payload': payload,
+            'station_id': station_id,
+            'created_at': datetime.now()
+        })
+    except queue.Full:
+        logger.warning("通讯日志队列已满，丢弃日志: %s", topic)
+
+
+def _comm_log_writer():
+    """通讯日志写入线程，取到停止标记 None 时写出当前批次后退出"""
+    while True:
+        row = _comm_log_queue.get()
+        if row is None:
+            return
+        batch = [row]
+        deadline = time.monotonic() + COMM_LOG_FLUSH_INTERVAL
+        while len(batch) < COMM_LOG_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                row = _comm_log_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if row is None:
+                flush_comm_logs(batch)
+                return
+            batch.append(row)
+        flush_comm_logs(batch)
+
+
+def stop_comm_log_writer(writer_thread):
+    """停止通讯日志写入线程，并按批写出队列中剩余的全部日志（进程退出时调用）"""
+    _comm_log_queue.put(None)
+    writer_thread.join()
+    
+    batch = []
+    while True:
+        try:
+            batch.append(_comm_log_queue.get_nowait())
+        except queue.Empty:
+            break
+        if len(batch) == COMM_LOG_BATCH_SIZE:
+            flush_comm_logs(batch)
+            batch = []
+    if batch:
+        flush_comm_logs(batch)
+
+
+def flush_comm_logs(batch):
+    """批量写入通讯日志
+    
+    直接使用 Core insert 执行 executemany，不经过 ORM 对象构造和 flush。
+    """
+    for row in batch:
+        row['payload'] = row['payload'].decode('utf-8', 'replace')
+    
+    try:
+        with flask_app.app_context(), db.engine.begin() as conn:
+            conn.execute(CommLog.__table__.insert(), batch)
+    except Exception as e:
+        logger.error("写入通讯日志失败（%s 条）: %s", len(batch), e)
+
+
+def dispatch_message(handler, imei, payload):
+    """在应用上下文中调用消息处理函数，payload 保持原始 bytes"""
+    try:
+        logger.debug("收到消息: %s %s -> %s", handler.__name__, imei, payload)
         
         with flask_app.app_context():
-            if topic.startswith(flask_app.config['INDOOR_PUB_PREFIX']):
-                # 室内机消息
-                imei = topic.split('/')[-1]
-                handle_indoor_message(imei, payload)
-            elif topic.startswith(flask_app.config['OUTDOOR_PUB_PREFIX']):
-                # 室外机消息
-                imei = topic.split('/')[-1]
-                handle_outdoor_message(imei, payload)
+            handler(imei, payload)
     except Exception as e:
-        print(f"处理消息出错: {e}")
+        logger.exception("处理消息出错: %s", e)
 
 
 def handle_indoor_message(imei, payload):
     """处理室内机消息"""
-    from app.models import Device, AlarmLog, CommLog
-    from app import db
-    
     # 自动注册或更新设备
     device = auto_register_device(imei, 'indoor')
     if not device:
         return
     
     # 更新在线时间
-    device.last_seen = datetime.now()
-    db.session.commit()
+    touch_device(device)
     
     # 记录接收通讯日志
-    receive_log = CommLog(
+    log_comm(
         direction='receive',
         source_type='indoor',
         source_imei=imei,
@@ -117,53 +316,42 @@ def handle_indoor_message(imei, payload):
         payload=payload,
         station_id=device.station_id
     )
-    db.session.add(receive_log)
-    db.session.commit()
     
     # 解析消息
     try:
-        data = json.loads(payload)
+        data = orjson.loads(payload)
     except:
-        print(f"无法解析消息: {payload}")
+        logger.debug("无法解析消息: %s", payload)
         return
     
     # 检查是否绑定加油站
     if not device.station_id:
-        print(f"设备 {imei} 未绑定加油站，不转发")
+        logger.debug("设备 %s 未绑定加油站，不转发", imei)
         return
     
     # 获取同站室外机
-    outdoor_devices = Device.query.filter_by(
-        station_id=device.station_id,
-        type='outdoor'
-    ).all()
+    outdoor_targets = get_station_targets(device.station_id, 'outdoor')
     
-    if not outdoor_devices:
-        print(f"加油站 {device.station_id} 没有室外机")
+    if not outdoor_targets:
+        logger.debug("加油站 %s 没有室外机", device.station_id)
         return
     
-    # 转发消息给所有室外机
-    outdoor_imeis = []
-    for outdoor in outdoor_devices:
-        target_topic = flask_app.config['OUTDOOR_SUB_PREFIX'] + outdoor.imei
-        mqtt_client.publish(target_topic, payload)
-        outdoor_imeis.append(outdoor.imei)
-        print(f"转发到室外机: {target_topic}")
+    # 转发消息给所有室外机，原始 bytes 直接发布
+    for outdoor_imei, target_topic in outdoor_targets:
+        mqtt_client.publish(target_topic, payload, qos=0)
+        logger.debug("转发到室外机: %s", target_topic)
         
         # 记录转发通讯日志
-        forward_log = CommLog(
+        log_comm(
             direction='forward',
             source_type='indoor',
             source_imei=imei,
             target_type='outdoor',
-            target_imei=outdoor.imei,
+            target_imei=outdoor_imei,
             topic=target_topic,
             payload=payload,
             station_id=device.station_id
         )
-        db.session.add(forward_log)
-    
-    db.session.commit()
     
     # 记录报警日志
     if 'bj' in data:
@@ -172,43 +360,38 @@ def handle_indoor_message(imei, payload):
         if isinstance(bj_value, str):
             bj_value = int(bj_value)
         alarm_type = 'alarm' if bj_value == 1 else 'cancel'
-        alarm_log = AlarmLog(
+        db.session.execute(AlarmLog.__table__.insert().values(
             station_id=device.station_id,
             indoor_imei=imei,
             alarm_type=alarm_type,
-            outdoor_imeis=json.dumps(outdoor_imeis),
+            outdoor_imeis=[outdoor_imei for outdoor_imei, _ in outdoor_targets],
             forward_status=1
-        )
-        db.session.add(alarm_log)
+        ))
         db.session.commit()
-        print(f"记录报警日志: {alarm_type}")
+        logger.info("记录报警日志: %s", alarm_type)
 
 
 def handle_outdoor_message(imei, payload):
     """处理室外机消息"""
-    from app.models import Device, CommLog
-    from app import db
-    
     # 自动注册或更新设备
     device = auto_register_device(imei, 'outdoor')
     if not device:
         return
     
-    # 更新在线时间
-    device.last_seen = datetime.now()
-    
-    # 解析消息，更新电池电量
+    # 解析消息，获取电池电量
+    vbat = None
     try:
-        data = json.loads(payload)
+        data = orjson.loads(payload)
         if 'vbat' in data:
-            device.vbat = data['vbat']
+            vbat = data['vbat']
     except:
         pass
     
-    db.session.commit()
+    # 更新在线时间和电池电量
+    touch_device(device, vbat)
     
     # 记录接收通讯日志
-    receive_log = CommLog(
+    log_comm(
         direction='receive',
         source_type='outdoor',
         source_imei=imei,
@@ -216,72 +399,131 @@ def handle_outdoor_message(imei, payload):
         payload=payload,
         station_id=device.station_id
     )
-    db.session.add(receive_log)
-    db.session.commit()
     
     # 检查是否绑定加油站
     if not device.station_id:
-        print(f"设备 {imei} 未绑定加油站，不转发")
+        logger.debug("设备 %s 未绑定加油站，不转发", imei)
         return
     
     # 获取同站室内机
-    indoor_device = Device.query.filter_by(
-        station_id=device.station_id,
-        type='indoor'
-    ).first()
+    indoor_targets = get_station_targets(device.station_id, 'indoor')
     
-    if not indoor_device:
-        print(f"加油站 {device.station_id} 没有室内机")
+    if not indoor_targets:
+        logger.debug("加油站 %s 没有室内机", device.station_id)
         return
     
     # 转发消息给室内机
-    target_topic = flask_app.config['INDOOR_SUB_PREFIX'] + indoor_device.imei
-    mqtt_client.publish(target_topic, payload)
-    print(f"转发到室内机: {target_topic}")
+    indoor_imei, target_topic = indoor_targets[0]
+    mqtt_client.publish(target_topic, payload, qos=0)
+    logger.debug("转发到室内机: %s", target_topic)
     
     # 记录转发通讯日志
-    forward_log = CommLog(
+    log_comm(
         direction='forward',
         source_type='outdoor',
         source_imei=imei,
         target_type='indoor',
-        target_imei=indoor_device.imei,
+        target_imei=indoor_imei,
         topic=target_topic,
         payload=payload,
         station_id=device.station_id
     )
-    db.session.add(forward_log)
-    db.session.commit()
+
+
+def touch_device(device, vbat=None):
+    """更新设备在线时间和电池电量（写回缓存，由写回线程定期落库）"""
+    now = datetime.now()
+    with _cache_lock:
+        device.last_seen = now
+        if vbat is not None:
+            device.vbat = vbat
+        state = {'device_id': device.id, 'last_seen': now, 'vbat': device.vbat}
+    with _pending_lock:
+        _pending_device_state[device.id] = state
+
+
+def _device_state_writer():
+    """设备状态写回线程"""
+    while True:
+        time.sleep(DEVICE_STATE_FLUSH_INTERVAL)
+        flush_device_state()
+
+
+def flush_device_state():
+    """将缓存的设备在线时间和电量批量写入数据库"""
+    global _pending_device_state
+    with _pending_lock:
+        pending, _pending_device_state = _pending_device_state, {}
+    if not pending:
+        return
+    
+    try:
+        with flask_app.app_context(), db.engine.begin() as conn:
+            conn.execute(_device_state_update, list(pending.values()))
+    except Exception as e:
+        logger.error("写入设备状态失败（%s 台）: %s", len(pending), e)
+
+
+def get_station_targets(station_id, device_type):
+    """获取加油站下指定类型设备的 ((IMEI, 订阅Topic), ...)（带缓存）"""
+    key = (station_id, device_type)
+    with _cache_lock:
+        targets = _station_device_cache.get(key)
+    if targets is None:
+        sub_prefix = flask_app.config['INDOOR_SUB_PREFIX' if device_type == 'indoor' else 'OUTDOOR_SUB_PREFIX']
+        targets = tuple(
+            (imei, sub_prefix + imei)
+            for imei in db.session.execute(
+                db.select(Device.imei)
+                .where(Device.station_id == station_id, Device.type == device_type)
+                .order_by(Device.id)
+            ).scalars()
+        )
+        with _cache_lock:
+            _station_device_cache[key] = targets
+    return targets
 
 
 def auto_register_device(imei, device_type):
     """自动注册设备，如果设备类型不匹配则修正并解绑"""
-    from app.models import Device
-    from app import db
+    with _cache_lock:
+        device = _device_cache.get(imei)
     
-    device = Device.query.filter_by(imei=imei).first()
+    if device is None:
+        row = Device.query.filter_by(imei=imei).first()
+        
+        if not row:
+            # 自动创建设备
+            row = Device(
+                imei=imei,
+                type=device_type,
+                name=f"自动注册-{imei}",
+                last_seen=datetime.now()
+            )
+            db.session.add(row)
+            db.session.commit()
+            logger.info("自动注册设备: %s (%s)", imei, device_type)
+        
+        device = CachedDevice(row)
+        with _cache_lock:
+            _device_cache[imei] = device
     
-    if not device:
-        # 自动创建设备
-        device = Device(
-            imei=imei,
-            type=device_type,
-            name=f"自动注册-{imei}",
-            last_seen=datetime.now()
-        )
-        db.session.add(device)
-        db.session.commit()
-        print(f"自动注册设备: {imei} ({device_type})")
-    elif device.type != device_type:
+    if device.type != device_type:
         # 设备类型不匹配，修正类型并解绑
         old_type = device.type
         old_type_name = '室内机' if old_type == 'indoor' else '室外机'
         new_type_name = '室内机' if device_type == 'indoor' else '室外机'
         
-        print(f"设备 {imei} 类型不匹配: 绑定为{old_type_name}，实际为{new_type_name}，自动修正并解绑")
+        logger.warning("设备 %s 类型不匹配: 绑定为%s，实际为%s，自动修正并解绑", imei, old_type_name, new_type_name)
         
-        device.type = device_type
-        device.station_id = None  # 解绑
+        db.session.execute(
+            db.update(Device).where(Device.id == device.id).values(type=device_type, station_id=None)
+        )
         db.session.commit()
+        
+        with _cache_lock:
+            _station_device_cache.pop((device.station_id, old_type), None)
+            device.type = device_type
+            device.station_id = None  # 解绑
     
     return device
@@ -0,0 +1,114 @@
+"""
+通用工具函数
+"""
+import base64
+from datetime import datetime
+import orjson
+from flask import g, current_app, Response, stream_with_context
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import or_, and_
+from sqlalchemy.dialects.mysql import match
+from app import db
+from app.models import User, Station
+
+
+def current_user():
+    """获取当前登录用户，同一请求内只查询一次"""
+    if 'current_user' not in g:
+        g.current_user = db.session.get(User, get_jwt_identity())
+    return g.current_user
+
+
+def like_pattern(search):
+    """构建包含匹配的 LIKE 模式，转义 % 和 _ 使其按字面匹配（配合 escape='\\' 使用）"""
+    escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def search_condition(columns, search):
+    """构建多列模糊搜索条件，任一列匹配即可
+    
+    MySQL 下各搜索列建有 ngram 全文索引，使用 MATCH ... AGAINST 短语匹配走索引；
+    其他数据库或搜索词短于 ngram 长度时退回 LIKE 全表扫描。
+    """
+    phrase = search.replace('"', '')
+    if db.engine.dialect.name == 'mysql' and len(phrase) >= current_app.config['FULLTEXT_NGRAM_SIZE']:
+        return or_(*(match(column, against=f'"{phrase}"').in_boolean_mode() for column in columns))
+    pattern = like_pattern(search)
+    return or_(*(column.like(pattern, escape='\\') for column in columns))
+
+
+def station_name_map(items):
+    """批量查询列表中各条记录所属加油站的名称，返回 {加油站ID: 名称}"""
+    station_ids = {item.station_id for item in items if item.station_id}
+    if not station_ids:
+        return {}
+    return dict(db.session.execute(
+        db.select(Station.id, Station.name).where(Station.id.in_(station_ids))
+    ).all())
+
+
+def encode_cursor(created_at, row_id):
+    """将 (created_at, id) 编码为分页游标"""
+    raw = f'{created_at.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析分页游标，格式错误时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, row_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (UnicodeError, TypeError, base64.binascii.Error) as e:
+        raise ValueError(f'无效的游标: {cursor}') from e
+
+
+def keyset_paginate(query, model, cursor, per_page):
+    """按 (created_at DESC, id DESC) 游标分页
+    
+    cursor 为空表示第一页。返回 (items, next_cursor)，没有下一页时 next_cursor 为 None。
+    游标格式错误或 per_page 小于 1 时抛出 ValueError。
+    """
+    if per_page < 1:
+        raise ValueError(f'无效的每页条数: {per_page}')
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id)
+        ))
+    
+    items = query.order_by(model.created_at.desc(), model.id.desc()).limit(per_page + 1).all()
+    
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+    return items, next_cursor
+
+
+def _stream_json(head, items, serialize, tail):
+    """依次输出 head、逗号分隔的各条 serialize(item) 和 tail"""
+    def generate():
+        yield head
+        for i, item in enumerate(items):
+            if i:
+                yield b','
+            yield orjson.dumps(serialize(item))
+        yield tail
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def stream_array_response(items, serialize, code=200, message='获取成功'):
+    """以流式方式输出 data 为数组的响应，items 可以是 yield_per 的查询结果，边读边写
+    
+    输出格式与 jsonify({'code': code, 'message': message, 'data': [serialize(item), ...]}) 相同。
+    """
+    return _stream_json(
+        orjson.dumps({'code': code, 'message': message})[:-1] + b',"data":[',
+        items,
+        serialize,
+        b']}'
+    )
@@ -1,40 +1,119 @@
 """
 应用配置文件
+
+数据库、MQTT 账号和密钥等敏感配置只从环境变量读取，不在代码中保存默认值。
+可在 backend/.env 中配置（参考 .env.example），已存在的环境变量优先。
 """
 import os
+import sys
 from datetime import timedelta
+from urllib.parse import quote_plus
+from dotenv import load_dotenv
+from sqlalchemy.pool import StaticPool
+
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+
+
+def _default_mysql_driver():
+    """默认数据库驱动
+    
+    gunicorn 的 gevent worker 中（socket 已被打补丁）使用 pymysql（纯 Python），查询等待时只挂起当前协程；
+    mysqlclient 是 C 实现，gevent 无法对其打补丁，一次查询会阻塞整个 worker 的所有请求。
+    其他场景（mqtt_worker.py、开发服务器）使用 mysqldb（mysqlclient），驱动本身的 CPU 开销更低。
+    """
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('socket'):
+        return 'pymysql'
+    return 'mysqldb'
 
 
 class Config:
     """基础配置"""
+    # 启动时必须提供的环境变量，缺失时 create_app 直接报错
+    REQUIRED_ENV = (
+        'SECRET_KEY', 'JWT_SECRET_KEY',
+        'MYSQL_HOST', 'MYSQL_USER', 'MYSQL_PASSWORD',
+        'MQTT_BROKER_HOST', 'MQTT_USERNAME', 'MQTT_PASSWORD'
+    )
+    
     # Flask 配置
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'gas-station-monitor-secret-key-2024'
+    SECRET_KEY = os.environ.get('SECRET_KEY')
     
     # 数据库配置
-    MYSQL_HOST = os.environ.get('MYSQL_HOST') or '47.104.166.179'
-    MYSQL_PORT = os.environ.get('MYSQL_PORT') or '16768'
-    MYSQL_USER = os.environ.get('MYSQL_USER') or 'snsy_alarm'
-    MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD') or 'BT3GYBXJFsaeyRzX'
+    MYSQL_HOST = os.environ.get('MYSQL_HOST') or 'localhost'
+    MYSQL_PORT = os.environ.get('MYSQL_PORT') or '3306'
+    MYSQL_USER = os.environ.get('MYSQL_USER') or ''
+    MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD') or ''
     MYSQL_DATABASE = os.environ.get('MYSQL_DATABASE') or 'snsy_alarm'
     
+    # 数据库驱动：默认见 _default_mysql_driver()，也可通过 MYSQL_DRIVER 指定 mysqldb 或 pymysql
+    MYSQL_DRIVER = os.environ.get('MYSQL_DRIVER') or _default_mysql_driver()
+    
     SQLALCHEMY_DATABASE_URI = (
-        f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}?charset=utf8mb4"
+        f"mysql+{MYSQL_DRIVER}://{quote_plus(MYSQL_USER)}:{quote_plus(MYSQL_PASSWORD)}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
+        f"?charset=utf8mb4&binary_prefix=true"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False  # 设为 True 可打印 SQL 语句
+    # 连接池配置：MySQL 的 wait_timeout 必须大于 pool_recycle，否则空闲连接会先被服务端断开
+    # LIFO 优先复用最近归还的连接，空闲连接自然超时回收；
+    # READ COMMITTED 减少日志表批量插入时 InnoDB 的间隙锁竞争
+    # 连接池大小按进程计算：每个 gunicorn worker 和 mqtt_worker.py 各有一个连接池，总连接数上限为
+    # (GUNICORN_WORKERS + 1) × (DB_POOL_SIZE + DB_MAX_OVERFLOW)，需小于 MySQL 的 max_connections（默认 151）。
+    # 默认每个进程最多 10 个连接，8 核主机约 90 个；mqtt_worker.py 的 8 个处理线程和 2 个写入线程也恰好够用
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 5)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+        'pool_use_lifo': True,
+        'isolation_level': 'READ COMMITTED'
+    }
+    
+    # 全文索引 ngram 长度，需与 MySQL 的 ngram_token_size 一致
+    # 同时建议关闭 innodb_ft_enable_stopword，避免含停用词的编号搜不到
+    FULLTEXT_NGRAM_SIZE = 2
+    
+    # 响应压缩：超过阈值（字节）的 JSON 响应按客户端 Accept-Encoding 压缩
+    COMPRESS_MIMETYPES = ['application/json', 'text/html', 'text/css', 'application/javascript']
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_ALGORITHM = ['br', 'gzip']
+    # 流式输出的响应（用户列表）不压缩：Flask-Compress 压缩流式响应时会先读取完整响应体，就不再边查边写；
+    # 其他列表整页已在内存中，照常压缩
+    COMPRESS_STREAMS = False
     
     # JWT 配置
-    JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key-2024'
+    JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     JWT_TOKEN_LOCATION = ['headers']
     JWT_HEADER_NAME = 'Authorization'
     JWT_HEADER_TYPE = 'Bearer'
     
+    # 密码哈希算法：argon2（默认）或 bcrypt；BCRYPT_COST 为 bcrypt 的轮数（2^cost 次迭代），
+    # 成本越高单次登录越耗 CPU，暴力破解的代价也越高
+    PASSWORD_HASH_SCHEME = os.environ.get('PASSWORD_HASH_SCHEME') or 'argon2'
+    BCRYPT_COST = int(os.environ.get('BCRYPT_COST') or 10)
+    
+    # 登录密码校验：执行器类型（thread 线程池 / process 进程池）、并发数与等待超时（秒）
+    # 登录量大时可设为 process，哈希计算分摊到多个 CPU 核心；执行器类型只对 sync/gthread worker
+    # 和开发服务器生效，gevent worker 下固定使用 gevent 的原生线程池，避免哈希计算阻塞事件循环
+    LOGIN_HASH_EXECUTOR = os.environ.get('LOGIN_HASH_EXECUTOR') or 'thread'
+    LOGIN_HASH_WORKERS = int(os.environ.get('LOGIN_HASH_WORKERS') or 4)
+    LOGIN_HASH_TIMEOUT = 2
+    
     # MQTT 配置
-    MQTT_BROKER_HOST = os.environ.get('MQTT_BROKER_HOST') or '47.104.166.179'
+    MQTT_BROKER_HOST = os.environ.get('MQTT_BROKER_HOST') or 'localhost'
     MQTT_BROKER_PORT = int(os.environ.get('MQTT_BROKER_PORT') or '1883')
-    MQTT_USERNAME = os.environ.get('MQTT_USERNAME') or 'mqtt_user'
-    MQTT_PASSWORD = os.environ.get('MQTT_PASSWORD') or 'mqtt_password'
+    MQTT_USERNAME = os.environ.get('MQTT_USERNAME') or ''
+    MQTT_PASSWORD = os.environ.get('MQTT_PASSWORD') or ''
+    MQTT_KEEPALIVE = 60  # 心跳间隔（秒）
+    MQTT_MAX_INFLIGHT = 1000  # QoS>0 未确认消息上限
+    MQTT_MAX_QUEUED = 10000  # 发送队列上限，超出后 publish 返回错误而不是无限占用内存
+    MQTT_RECONNECT_MIN_DELAY = 1  # 重连退避下限（秒）
+    MQTT_RECONNECT_MAX_DELAY = 30  # 重连退避上限（秒）
+    MQTT_LOG_LEVEL = os.environ.get('MQTT_LOG_LEVEL') or 'INFO'  # 设为 DEBUG 可输出每条消息的处理过程
     
     # MQTT Topic 前缀
     INDOOR_PUB_PREFIX = '/AIR8000/PUB/'
@@ -45,6 +124,9 @@ class Config:
     # 设备离线判定时间（小时）
     DEVICE_OFFLINE_HOURS = 13
     
+    # 启动时建表并创建默认管理员；生产环境多 worker 下应关闭，改为部署时执行一次 flask db-init
+    RUN_DB_INIT = os.environ.get('RUN_DB_INIT') == '1'
+    
     # 默认管理员账号
     DEFAULT_ADMIN_USERNAME = 'admin'
     DEFAULT_ADMIN_PASSWORD = 'admin123'
@@ -54,6 +136,8 @@ class DevelopmentConfig(Config):
     """开发环境配置"""
     DEBUG = True
     SQLALCHEMY_ECHO = True
+    MQTT_LOG_LEVEL = os.environ.get('MQTT_LOG_LEVEL') or 'DEBUG'
+    RUN_DB_INIT = os.environ.get('RUN_DB_INIT', '1') == '1'
 
 
 class ProductionConfig(Config):
@@ -64,7 +148,19 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     """测试环境配置"""
     TESTING = True
+    REQUIRED_ENV = ()
+    SECRET_KEY = 'testing-secret-key'
+    JWT_SECRET_KEY = 'testing-jwt-secret-key'
+    # 内存数据库：所有会话共用同一个连接，否则每个连接都是一个新的空库
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': StaticPool,
+        'connect_args': {'check_same_thread': False}
+    }
+    # 建表和默认管理员由测试夹具创建
+    RUN_DB_INIT = False
+    PASSWORD_HASH_SCHEME = 'bcrypt'
+    BCRYPT_COST = 4
 
 
 # 配置映射
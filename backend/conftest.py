@@ -0,0 +1,89 @@
+"""
+pytest 公共夹具：整个测试会话共用一个应用、测试客户端和管理员请求头
+"""
+import os
+import sys
+
+import pytest
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from app import create_app, db, init_db
+
+
+@pytest.fixture(scope='session')
+def app():
+    """测试会话共用的 Flask 应用，使用内存 SQLite，建表并创建默认管理员"""
+    app = create_app('testing')
+    with app.app_context():
+        _enable_sqlite_savepoints(db.engine)
+        init_db(app)
+    return app
+
+
+def _enable_sqlite_savepoints(engine):
+    """让 SQLAlchemy 接管 pysqlite 的事务，SAVEPOINT 才能正常工作（db_txn 依赖）
+    
+    pysqlite 默认自行决定何时 BEGIN，与 SAVEPOINT 配合时会提前提交；
+    需在首次连接前注册：关闭驱动的事务管理，由 begin 事件显式发出 BEGIN。
+    """
+    @event.listens_for(engine, 'connect')
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+    
+    @event.listens_for(engine, 'begin')
+    def emit_begin(conn):
+        conn.exec_driver_sql('BEGIN')
+
+
+@pytest.fixture
+def app_context(app):
+    """单个测试内的应用上下文
+    
+    不在整个会话内保持：测试客户端的请求会复用已推入的应用上下文，g 会在请求之间共享。
+    """
+    with app.app_context():
+        yield
+
+
+@pytest.fixture(scope='session')
+def client(app):
+    """测试会话共用的测试客户端"""
+    return app.test_client()
+
+
+@pytest.fixture(scope='session')
+def admin_headers(client):
+    """管理员请求头，整个会话只登录一次（只做一次密码哈希校验）"""
+    response = client.post('/api/auth/login', json={
+        'username': 'admin',
+        'password': 'admin123'
+    })
+    return {'Authorization': f"Bearer {response.get_json()['data']['token']}"}
+
+
+@pytest.fixture
+def db_txn(app):
+    """在外层事务中运行测试，结束后回滚，测试数据不落库
+    
+    测试期间默认引擎替换为同一个连接，请求中的会话都加入该连接上的事务，
+    接口内的 commit 只释放 SAVEPOINT。不推入应用上下文，原因同 app_context。
+    """
+    with app.app_context():
+        engines = db.engines
+    engine = engines[None]
+    conn = engine.connect()
+    txn = conn.begin()
+    engines[None] = conn
+    session_kw = db.session.session_factory.kw
+    session_kw['join_transaction_mode'] = 'create_savepoint'
+    try:
+        yield
+    finally:
+        del session_kw['join_transaction_mode']
+        engines[None] = engine
+        txn.rollback()
+        conn.close()
@@ -0,0 +1,17 @@
+"""
+Gunicorn 配置文件
+
+gunicorn 只处理 HTTP 请求；MQTT 服务由 mqtt_worker.py 作为独立进程运行，
+避免多个 worker 重复连接 MQTT Broker，也避免 worker 从带后台线程的进程 fork 出来。
+"""
+import multiprocessing
+import os
+
+bind = f"{os.environ.get('FLASK_HOST') or '0.0.0.0'}:{os.environ.get('FLASK_PORT') or 5000}"
+workers = int(os.environ.get('GUNICORN_WORKERS') or multiprocessing.cpu_count())
+# gevent worker 中数据库默认使用 pymysql，见 config.py 中的 _default_mysql_driver()
+worker_class = 'gevent'
+worker_connections = 1000
+
+# 不预加载应用：每个 worker 在 gevent 打补丁之后各自创建应用、数据库连接池和线程池
+preload_app = False
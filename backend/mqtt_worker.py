@@ -0,0 +1,34 @@
+"""
+MQTT 转发服务入口（生产环境）
+
+与 gunicorn 分开，作为单独的进程运行，保证全局只有一个 MQTT 连接：
+    python mqtt_worker.py
+"""
+import os
+import signal
+import sys
+import threading
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.services.mqtt_service import start_mqtt_service
+
+
+def main():
+    app = create_app(os.environ.get('FLASK_ENV') or 'production')
+    start_mqtt_service(app)
+    
+    # 收到 SIGTERM 时按正常流程退出，与 Ctrl+C 一致
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    # MQTT 网络循环和消息处理都在后台线程中，主线程等待退出信号
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,508 +1,322 @@
 """
-后端 API 基础功能测试脚本
+后端 API 基础功能测试
 用于检查点 6 - 验证后端 API 基础功能
+
+使用 pytest 运行（共用夹具见 conftest.py，依赖见 requirements-dev.txt）：pytest test_api.py
+需要并行时：pytest -n auto test_api.py
+也可直接运行：python test_api.py
 """
 import sys
 import os
+import subprocess
+from datetime import datetime, timedelta
+
+import pytest
 
 # 添加当前目录到路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import create_app, db
+from app import db
+from app.auth_hash import verify_password, needs_rehash
 from app.models import User, Station, Device, AlarmLog
 
 
+# 认证测试的请求体，模块加载时构造一次
+ADMIN_LOGIN = {'username': 'admin', 'password': 'admin123'}
+WRONG_PASSWORD_LOGIN = {'username': 'admin', 'password': 'wrongpassword'}
+UNKNOWN_USER_LOGIN = {'username': 'nonexistent', 'password': 'password'}
+
+
+def assert_response(response, code=200):
+    """断言 HTTP 状态码和响应体中的 code 均为预期值，失败时附带响应内容，返回响应数据"""
+    data = response.get_json()
+    assert response.status_code == code and data.get('code') == code, data
+    return data
+
+
+def seed(app, *objs):
+    """写入测试数据（配合 db_txn 使用，测试结束后回滚），返回各对象的 id"""
+    with app.app_context():
+        db.session.add_all(objs)
+        db.session.commit()
+        return [obj.id for obj in objs]
+
+
+@pytest.mark.usefixtures('app_context')
 def test_database_connection():
     """测试数据库连接"""
-    print("=" * 50)
-    print("测试 1: 数据库连接")
-    print("=" * 50)
-    
-    app = create_app('development')
-    with app.app_context():
-        try:
-            # 尝试执行简单查询
-            result = db.session.execute(db.text('SELECT 1')).fetchone()
-            print(f"✓ 数据库连接成功: {result}")
-            return True
-        except Exception as e:
-            print(f"✗ 数据库连接失败: {e}")
-            return False
+    assert db.session.execute(db.text('SELECT 1')).scalar() == 1
 
 
+@pytest.mark.usefixtures('app_context')
 def test_tables_exist():
     """测试数据库表是否存在"""
-    print("\n" + "=" * 50)
-    print("测试 2: 数据库表结构")
-    print("=" * 50)
-    
-    app = create_app('development')
-    with app.app_context():
-        try:
-            # 检查各表是否存在
-            tables = ['users', 'stations', 'devices', 'alarm_logs', 'user_stations']
-            for table in tables:
-                result = db.session.execute(
-                    db.text(f"SHOW TABLES LIKE '{table}'")
-                ).fetchone()
-                if result:
-                    print(f"✓ 表 {table} 存在")
-                else:
-                    print(f"✗ 表 {table} 不存在")
-                    return False
-            return True
-        except Exception as e:
-            print(f"✗ 检查表结构失败: {e}")
-            return False
+    # 一次读取全部表名，再与预期比对
+    tables = {'users', 'stations', 'devices', 'alarm_logs', 'comm_logs', 'user_stations'}
+    missing = tables - set(db.inspect(db.engine).get_table_names())
+    assert not missing, f"缺少表: {sorted(missing)}"
+
+
+# 在新进程中导入模型并记录映射时发出的 SQLAlchemy 弃用警告。
+# 不能把警告设为错误：SQLAlchemy 解析注解时会吞掉求值中抛出的异常
+MODEL_IMPORT_CHECK = """
+import warnings
+from sqlalchemy.exc import SADeprecationWarning
+with warnings.catch_warnings(record=True) as caught:
+    warnings.simplefilter('always', SADeprecationWarning)
+    import app.models
+messages = [str(w.message) for w in caught if issubclass(w.category, SADeprecationWarning)]
+assert not messages, messages
+"""
 
 
+def test_models_map_without_deprecation_warnings():
+    """测试模型映射时没有 SQLAlchemy 弃用警告（Device.type 列遮蔽 type[Query] 注解，见 IntEnumType）"""
+    result = subprocess.run(
+        [sys.executable, '-c', MODEL_IMPORT_CHECK],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.mark.usefixtures('app_context')
 def test_default_admin():
     """测试默认管理员是否创建"""
-    print("\n" + "=" * 50)
-    print("测试 3: 默认管理员账号")
-    print("=" * 50)
+    # 只查询需要的列，不构造 User 对象
+    admin = db.session.execute(
+        db.select(User.role, User.password_hash).filter_by(username='admin')
+    ).one_or_none()
+    assert admin is not None, "默认管理员不存在"
+    assert admin.role == 'admin'
+    assert verify_password(admin.password_hash, ADMIN_LOGIN['password']), "默认密码验证失败"
+
+
+# 已有哈希：argon2（与当前参数一致）、bcrypt 成本 4 和 12（只需前缀可解析）
+ARGON2_HASH = '$argon2id$v=19$m=65536,t=2,p=1$c29tZXNhbHRzb21lc2FsdA$7mJ9M1Ax0t5s6D8hvcdVxk4pGm6Q5Rx0bCmS0EQvJlE'
+BCRYPT4_HASH = '$2b$04$' + 'a' * 53
+BCRYPT12_HASH = '$2b$12$' + 'a' * 53
+
+
+@pytest.mark.parametrize('scheme, cost, password_hash, expected', [
+    ('argon2', 10, ARGON2_HASH, False),
+    ('argon2', 10, BCRYPT12_HASH, True),
+    ('bcrypt', 10, ARGON2_HASH, False),
+    ('bcrypt', 10, BCRYPT4_HASH, True),
+    ('bcrypt', 10, BCRYPT12_HASH, False),
+], ids=['argon2-keep', 'bcrypt-to-argon2', 'argon2-no-downgrade', 'bcrypt-raise-cost', 'bcrypt-no-lower-cost'])
+@pytest.mark.usefixtures('app_context')
+def test_needs_rehash(app, monkeypatch, scheme, cost, password_hash, expected):
+    """测试登录后的哈希重新生成只升级不降级"""
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_SCHEME', scheme)
+    monkeypatch.setitem(app.config, 'BCRYPT_COST', cost)
+    assert needs_rehash(password_hash) is expected
+
+
+def test_auth_api(client):
+    """测试认证 API：登录、获取当前用户、登出"""
+    data = assert_response(client.post('/api/auth/login', json=ADMIN_LOGIN))
+    # 后续请求共用同一个请求头
+    headers = {'Authorization': f"Bearer {data['data']['token']}"}
     
-    app = create_app('development')
-    with app.app_context():
-        try:
-            admin = User.query.filter_by(username='admin').first()
-            if admin:
-                print(f"✓ 默认管理员存在: {admin.username}, 角色: {admin.role}")
-                # 验证密码
-                if admin.check_password('admin123'):
-                    print("✓ 默认密码验证成功")
-                    return True
-                else:
-                    print("✗ 默认密码验证失败")
-                    return False
-            else:
-                print("✗ 默认管理员不存在")
-                return False
-        except Exception as e:
-            print(f"✗ 检查默认管理员失败: {e}")
-            return False
-
-
-def test_auth_api():
-    """测试认证 API"""
-    print("\n" + "=" * 50)
-    print("测试 4: 认证 API")
-    print("=" * 50)
+    data = assert_response(client.get('/api/auth/me', headers=headers))
+    assert data['data']['username'] == 'admin'
     
-    app = create_app('development')
-    with app.test_client() as client:
-        # 测试登录 - 正确凭证
-        response = client.post('/api/auth/login', json={
-            'username': 'admin',
-            'password': 'admin123'
-        })
-        data = response.get_json()
-        
-        if response.status_code == 200 and data.get('code') == 200:
-            print("✓ 登录成功")
-            token = data['data']['token']
-            
-            # 测试获取当前用户
-            response = client.get('/api/auth/me', headers={
-                'Authorization': f'Bearer {token}'
-            })
-            data = response.get_json()
-            
-            if response.status_code == 200 and data.get('code') == 200:
-                print(f"✓ 获取当前用户成功: {data['data']['username']}")
-            else:
-                print(f"✗ 获取当前用户失败: {data}")
-                return False
-            
-            # 测试登出
-            response = client.post('/api/auth/logout', headers={
-                'Authorization': f'Bearer {token}'
-            })
-            data = response.get_json()
-            
-            if response.status_code == 200 and data.get('code') == 200:
-                print("✓ 登出成功")
-            else:
-                print(f"✗ 登出失败: {data}")
-                return False
-            
-            return True
-        else:
-            print(f"✗ 登录失败: {data}")
-            return False
-
-
-def test_auth_api_invalid():
+    assert_response(client.post('/api/auth/logout', headers=headers))
+
+
+def test_auth_api_invalid(client):
     """测试认证 API - 无效凭证"""
-    print("\n" + "=" * 50)
-    print("测试 5: 认证 API - 无效凭证")
-    print("=" * 50)
-    
-    app = create_app('development')
-    with app.test_client() as client:
-        # 测试登录 - 错误密码
-        response = client.post('/api/auth/login', json={
-            'username': 'admin',
-            'password': 'wrongpassword'
-        })
-        data = response.get_json()
-        
-        if response.status_code == 401 and data.get('code') == 401:
-            print("✓ 错误密码正确返回 401")
-        else:
-            print(f"✗ 错误密码应返回 401: {data}")
-            return False
-        
-        # 测试登录 - 不存在的用户
-        response = client.post('/api/auth/login', json={
-            'username': 'nonexistent',
-            'password': 'password'
-        })
-        data = response.get_json()
-        
-        if response.status_code == 401 and data.get('code') == 401:
-            print("✓ 不存在用户正确返回 401")
-            return True
-        else:
-            print(f"✗ 不存在用户应返回 401: {data}")
-            return False
-
-
-def test_user_api():
-    """测试用户管理 API"""
-    print("\n" + "=" * 50)
-    print("测试 6: 用户管理 API")
-    print("=" * 50)
+    # 错误密码
+    assert_response(client.post('/api/auth/login', json=WRONG_PASSWORD_LOGIN), 401)
+    # 不存在的用户
+    assert_response(client.post('/api/auth/login', json=UNKNOWN_USER_LOGIN), 401)
+
+
+@pytest.mark.parametrize('path', ['/api/users', '/api/stations', '/api/stations/stats', '/api/devices', '/api/alarms'])
+def test_list_api(client, admin_headers, path):
+    """测试各列表/统计接口"""
+    assert_response(client.get(path, headers=admin_headers))
+
+
+@pytest.mark.usefixtures('db_txn')
+def test_device_online_filter(app, client, admin_headers):
+    """测试设备列表按在线状态筛选：total 只统计筛选后的设备"""
+    now = datetime.now()
+    seed(
+        app,
+        Device(imei='100000000000001', type='indoor', last_seen=now),
+        Device(imei='100000000000002', type='outdoor', last_seen=now),
+        Device(imei='100000000000003', type='indoor', last_seen=now - timedelta(days=1)),
+        Device(imei='100000000000004', type='outdoor', last_seen=None),
+    )
     
-    app = create_app('development')
-    with app.test_client() as client:
-        # 先登录获取 token
-        response = client.post('/api/auth/login', json={
-            'username': 'admin',
-            'password': 'admin123'
-        })
-        token = response.get_json()['data']['token']
-        headers = {'Authorization': f'Bearer {token}'}
-        
-        # 获取用户列表
-        response = client.get('/api/users', headers=headers)
-        data = response.get_json()
-        
-        if response.status_code == 200 and data.get('code') == 200:
-            print(f"✓ 获取用户列表成功，共 {len(data['data'])} 个用户")
-        else:
-            print(f"✗ 获取用户列表失败: {data}")
-            return False
-        
-        # 创建测试用户
-        response = client.post('/api/users', headers=headers, json={
-            'username': 'test_user_checkpoint',
-            'password': 'test123',
-            'role': 'user'
-        })
-        data = response.get_json()
-        
-        if response.status_code == 200 and data.get('code') == 200:
-            test_user_id = data['data']['id']
-            print(f"✓ 创建用户成功: ID={test_user_id}")
-        elif data.get('code') == 409:
-            # 用户已存在，查找其 ID
-            response = client.get('/api/users', headers=headers)
-            users = response.get_json()['data']
-            test_user = next((u for u in users if u['username'] == 'test_user_checkpoint'), None)
-            if test_user:
-                test_user_id = test_user['id']
-                print(f"✓ 测试用户已存在: ID={test_user_id}")
-            else:
-                print("✗ 无法找到测试用户")
-                return False
-        else:
-            print(f"✗ 创建用户失败: {data}")
-            return False
-        
-        # 更新用户
-        response = client.put(f'/api/users/{test_user_id}', headers=headers, json={
-            'role': 'admin'
-        })
-        data = response.get_json()
-        
-        if response.status_code == 200 and data.get('code') == 200:
-            print(f"✓ 更新用户成功: 角色已改为 {data['data']['role']}")
-        else:
-            print(f"✗ 更新用户失败: {data}")
-            return False
-        
-        # 删除测试用户
-        response = client.delete(f'/api/users/{test_user_id}', headers=headers)
-        data = response.get_json()
-        
-        if response.status_code == 200 and data.get('code') == 200:
-            print("✓ 删除用户成功")
-            return True
-        else:
-            print(f"✗ 删除用户失败: {data}")
-            return False
-
-
-def test_station_api():
-    """测试加油站管理 API"""
-    print("\n" + "=" * 50)
-    print("测试 7: 加油站管理 API")
-    print("=" * 50)
+    for online, imeis in (('1', {'100000000000001', '100000000000002'}),
+                          ('0', {'100000000000003', '100000000000004'})):
+        data = assert_response(client.get(f'/api/devices?online={online}&per_page=1', headers=admin_headers))
+        assert data['data']['total'] == 2
+        assert len(data['data']['items']) == 1
+        
+        data = assert_response(client.get(f'/api/devices?online={online}&per_page=10', headers=admin_headers))
+        assert {item['imei'] for item in data['data']['items']} == imeis
+        assert all(item['online'] == (online == '1') for item in data['data']['items'])
+
+
+@pytest.mark.usefixtures('db_txn')
+def test_alarm_cursor_pagination(app, client, admin_headers):
+    """测试报警日志游标分页：created_at 相同时按 id 区分，逐页翻到最后不重不漏"""
+    now = datetime.now().replace(microsecond=0)
+    ids = seed(app, *(
+        AlarmLog(indoor_imei='100000000000001', alarm_type='alarm', created_at=created_at)
+        for created_at in [now] * 5 + [now - timedelta(minutes=1)] * 2
+    ))
+    # 期望顺序：created_at 倒序，相同时 id 倒序
+    expected = sorted(ids[:5], reverse=True) + sorted(ids[5:], reverse=True)
     
-    app = create_app('development')
-    with app.test_client() as client:
-        # 先登录获取 token
-        response = client.post('/api/auth/login', json={
-            'username': 'admin',
-            'password': 'admin123'
-        })
-        token = response.get_json()['data']['token']
-        headers = {'Authorization': f'Bearer {token}'}
-        
-        # 获取加油站列表
-        response = client.get('/api/stations', headers=headers)
-        data = response.get_json()
-        
-        if response.status_code == 200 and data.get('code') == 200:
-            print(f"✓ 获取加油站列表成功，共 {data['data']['total']} 个加油站")
-        else:
-            print(f"✗ 获取加油站列表失败: {data}")
-            return False
-        
-        # 创建测试加油站
-        response = client.post('/api/stations', headers=headers, json={
-            'name': '测试加油站_检查点',
-            'code': 'TEST_CHECKPOINT_001',
-            'address': '测试地址',
-            'contact': '测试联系人',
-            'phone': '13800138000'
-        })
-        data = response.get_json()
-        
-        if response.status_code == 200 and data.get('code') == 200:
-            test_station_id = data['data']['id']
-            print(f"✓ 创建加油站成功: ID={test_station_id}")
-        elif data.get('code') == 409:
-            # 加油站已存在，查找其 ID
-            response = client.get('/api/stations?search=TEST_CHECKPOINT_001', headers=headers)
-            stations = response.get_json()['data']['items']
-            if stations:
-                test_station_id = stations[0]['id']
-                print(f"✓ 测试加油站已存在: ID={test_station_id}")
-            else:
-                print("✗ 无法找到测试加油站")
-                return False
-        else:
-            print(f"✗ 创建加油站失败: {data}")
-            return False
-        
-        # 获取加油站详情
-        response = client.get(f'/api/stations/{test_station_id}', headers=headers)
-        data = response.get_json()
-        
-        if response.status_code == 200 and data.get('code') == 200:
-            print(f"✓ 获取加油站详情成功: {data['data']['name']}")
-        else:
-            print(f"✗ 获取加油站详情失败: {data}")
-            return False
-        
-        # 更新加油站
-        response = client.put(f'/api/stations/{test_station_id}', headers=headers, json={
-            'address': '更新后的地址'
-        })
-        data = response.get_json()
-        
-        if response.status_code == 200 and data.get('code') == 200:
-            print(f"✓ 更新加油站成功: 地址已改为 {data['data']['address']}")
-        else:
-            print(f"✗ 更新加油站失败: {data}")
-            return False
-        
-        # 删除测试加油站
-        response = client.delete(f'/api/stations/{test_station_id}', headers=headers)
-        data = response.get_json()
-        
-        if response.status_code == 200 and data.get('code') == 200:
-            print("✓ 删除加油站成功")
-            return True
-        else:
-            print(f"✗ 删除加油站失败: {data}")
-            return False
-
-
-def test_device_api():
-    """测试设备管理 API"""
-    print("\n" + "=" * 50)
-    print("测试 8: 设备管理 API")
-    print("=" * 50)
+    # 空游标即第一页
+    seen = []
+    cursor = ''
+    while cursor is not None:
+        data = assert_response(client.get('/api/alarms', headers=admin_headers, query_string={
+            'cursor': cursor,
+            'per_page': 2
+        }))
+        seen.extend(item['id'] for item in data['data']['items'])
+        cursor = data['data']['next_cursor']
     
-    app = create_app('development')
-    with app.test_client() as client:
-        # 先登录获取 token
-        response = client.post('/api/auth/login', json={
-            'username': 'admin',
-            'password': 'admin123'
-        })
-        token = response.get_json()['data']['token']
-        headers = {'Authorization': f'Bearer {token}'}
-        
-        # 获取设备列表
-        response = client.get('/api/devices', headers=headers)
-        data = response.get_json()
-        
-        if response.status_code == 200 and data.get('code') == 200:
-            print(f"✓ 获取设备列表成功，共 {data['data']['total']} 个设备")
-            return True
-        else:
-            print(f"✗ 获取设备列表失败: {data}")
-            return False
-
-
-def test_alarm_api():
-    """测试报警日志 API"""
-    print("\n" + "=" * 50)
-    print("测试 9: 报警日志 API")
-    print("=" * 50)
+    assert seen == expected
+
+
+@pytest.mark.parametrize('path', ['/api/alarms', '/api/comm-logs'])
+@pytest.mark.parametrize('params', [
+    {'cursor': 'not-base64!'},
+    {'cursor': 'bm90LWEtY3Vyc29y'},
+    {'cursor': '', 'per_page': 0},
+    {'cursor': '', 'per_page': -3},
+], ids=['base64', 'format', 'per_page-zero', 'per_page-negative'])
+def test_cursor_invalid(client, admin_headers, path, params):
+    """测试游标分页：格式错误的游标或小于 1 的每页条数返回 400"""
+    assert_response(client.get(path, headers=admin_headers, query_string=params), 400)
+
+
+@pytest.mark.usefixtures('db_txn')
+def test_bind_device(app, client, admin_headers):
+    """测试设备绑定：各错误码及其判断顺序，重复绑定到同一加油站成功"""
+    with app.app_context():
+        bound, other = Station(name='绑定测试站1', code='TEST_BIND_1'), Station(name='绑定测试站2', code='TEST_BIND_2')
+        db.session.add_all([bound, other])
+        db.session.flush()
+        db.session.add_all([
+            Device(imei='200000000000001', type='indoor', station_id=bound.id),
+            Device(imei='200000000000002', type='outdoor'),
+            Device(imei='200000000000003', type='indoor'),
+        ])
+        db.session.commit()
+        bound_id, other_id = bound.id, other.id
     
-    app = create_app('development')
-    with app.test_client() as client:
-        # 先登录获取 token
-        response = client.post('/api/auth/login', json={
-            'username': 'admin',
-            'password': 'admin123'
-        })
-        token = response.get_json()['data']['token']
-        headers = {'Authorization': f'Bearer {token}'}
-        
-        # 获取报警日志列表
-        response = client.get('/api/alarms', headers=headers)
-        data = response.get_json()
-        
-        if response.status_code == 200 and data.get('code') == 200:
-            print(f"✓ 获取报警日志列表成功，共 {data['data']['total']} 条记录")
-            return True
-        else:
-            print(f"✗ 获取报警日志列表失败: {data}")
-            return False
-
-
-def test_permission_control():
-    """测试权限控制"""
-    print("\n" + "=" * 50)
-    print("测试 10: 权限控制")
-    print("=" * 50)
+    # (IMEI, 请求体, 预期状态码, 预期提示中包含的内容)
+    cases = [
+        # 设备不存在优先于缺少 station_id
+        ('299999999999999', {}, 404, '设备不存在'),
+        ('200000000000002', {}, 400, '请指定加油站ID'),
+        ('200000000000002', {'station_id': 999999}, 404, '加油站不存在'),
+        # 已被其他加油站绑定优先于类型不符
+        ('200000000000001', {'station_id': other_id, 'expected_type': 'outdoor'}, 409, '绑定测试站1'),
+        ('200000000000002', {'station_id': bound_id, 'expected_type': 'indoor'}, 409, '不能绑定为室内机'),
+        ('200000000000003', {'station_id': bound_id}, 409, '已绑定室内机 200000000000001'),
+    ]
+    for imei, payload, code, message in cases:
+        data = assert_response(client.post(f'/api/devices/{imei}/bind', headers=admin_headers, json=payload), code)
+        assert message in data['message'], (imei, payload, data)
     
-    app = create_app('development')
-    with app.test_client() as client:
-        # 先用管理员创建一个普通用户
-        response = client.post('/api/auth/login', json={
-            'username': 'admin',
-            'password': 'admin123'
-        })
-        admin_token = response.get_json()['data']['token']
-        admin_headers = {'Authorization': f'Bearer {admin_token}'}
-        
-        # 创建普通用户
-        response = client.post('/api/users', headers=admin_headers, json={
-            'username': 'test_normal_user',
-            'password': 'test123',
-            'role': 'user'
-        })
-        data = response.get_json()
-        
-        if data.get('code') == 200:
-            test_user_id = data['data']['id']
-            print("✓ 创建普通用户成功")
-        elif data.get('code') == 409:
-            print("✓ 普通用户已存在")
-            # 查找用户 ID
-            response = client.get('/api/users', headers=admin_headers)
-            users = response.get_json()['data']
-            test_user = next((u for u in users if u['username'] == 'test_normal_user'), None)
-            test_user_id = test_user['id'] if test_user else None
-        else:
-            print(f"✗ 创建普通用户失败: {data}")
-            return False
-        
-        # 用普通用户登录
-        response = client.post('/api/auth/login', json={
-            'username': 'test_normal_user',
-            'password': 'test123'
-        })
-        
-        if response.status_code != 200:
-            print("✗ 普通用户登录失败")
-            return False
-        
-        user_token = response.get_json()['data']['token']
-        user_headers = {'Authorization': f'Bearer {user_token}'}
-        
-        # 普通用户尝试访问用户管理 API
-        response = client.get('/api/users', headers=user_headers)
-        data = response.get_json()
-        
-        if response.status_code == 403 and data.get('code') == 403:
-            print("✓ 普通用户访问用户管理 API 正确返回 403")
-        else:
-            print(f"✗ 普通用户访问用户管理 API 应返回 403: {data}")
-            # 清理测试用户
-            if test_user_id:
-                client.delete(f'/api/users/{test_user_id}', headers=admin_headers)
-            return False
-        
-        # 清理测试用户
-        if test_user_id:
-            response = client.delete(f'/api/users/{test_user_id}', headers=admin_headers)
-            if response.get_json().get('code') == 200:
-                print("✓ 清理测试用户成功")
-        
-        return True
+    # 重复绑定到当前加油站成功（不与自身冲突）
+    data = assert_response(client.post('/api/devices/200000000000001/bind', headers=admin_headers, json={
+        'station_id': bound_id,
+        'expected_type': 'indoor'
+    }))
+    assert data['data']['station_id'] == bound_id
+
 
+# 接口契约测试数据：(接口路径, 创建请求体, 是否有详情接口)
+CRUD_CASES = [
+    ('/api/users', {
+        'username': 'test_user_checkpoint',
+        'password': 'test123',
+        'role': 'user'
+    }, False),
+    ('/api/stations', {
+        'name': '测试加油站_检查点',
+        'code': 'TEST_CHECKPOINT',
+        'address': '测试地址',
+        'contact': '测试联系人',
+        'phone': '13800138000'
+    }, True),
+]
 
-def main():
-    """运行所有测试"""
-    print("\n" + "=" * 60)
-    print("  加油站液位监控平台 - 后端 API 基础功能检查点")
-    print("=" * 60)
+
+@pytest.mark.usefixtures('db_txn')
+@pytest.mark.parametrize('path, payload, has_detail', CRUD_CASES, ids=['users', 'stations'])
+def test_crud_api(client, admin_headers, path, payload, has_detail):
+    """测试用户/加油站管理 API（接口契约：创建、详情、删除）"""
+    # db_txn 保证每次都是干净的数据库，创建必然成功
+    data = assert_response(client.post(path, headers=admin_headers, json=payload))
+    item_id = data['data']['id']
     
-    results = []
+    if has_detail:
+        data = assert_response(client.get(f'{path}/{item_id}', headers=admin_headers))
+        assert data['data']['code'] == payload['code']
     
-    # 运行所有测试
-    results.append(("数据库连接", test_database_connection()))
-    results.append(("数据库表结构", test_tables_exist()))
-    results.append(("默认管理员账号", test_default_admin()))
-    results.append(("认证 API", test_auth_api()))
-    results.append(("认证 API - 无效凭证", test_auth_api_invalid()))
-    results.append(("用户管理 API", test_user_api()))
-    results.append(("加油站管理 API", test_station_api()))
-    results.append(("设备管理 API", test_device_api()))
-    results.append(("报警日志 API", test_alarm_api()))
-    results.append(("权限控制", test_permission_control()))
+    assert_response(client.delete(f'{path}/{item_id}', headers=admin_headers))
+
+
+# 模型测试数据：(模型, 创建字段, (更新字段, 新值))
+MODEL_CASES = [
+    (User, {'username': 'test_user_model', 'password_hash': '-', 'role': 'user'}, ('role', 'admin')),
+    (Station, {'name': '测试加油站_模型', 'code': 'TEST_MODEL', 'address': '测试地址'}, ('address', '更新后的地址')),
+]
+
+
+@pytest.mark.usefixtures('db_txn', 'app_context')
+@pytest.mark.parametrize('model, fields, update', MODEL_CASES, ids=['user', 'station'])
+def test_model_crud(model, fields, update):
+    """测试用户/加油站模型：创建、更新、删除在同一事务中完成，只提交一次"""
+    obj = model(**fields)
+    db.session.add(obj)
+    db.session.flush()
     
-    # 输出总结
-    print("\n" + "=" * 60)
-    print("  测试结果总结")
-    print("=" * 60)
+    column, value = update
+    setattr(obj, column, value)
+    db.session.flush()
+    assert db.session.scalar(db.select(getattr(model, column)).where(model.id == obj.id)) == value
     
-    passed = 0
-    failed = 0
+    db.session.delete(obj)
+    db.session.commit()
+    assert db.session.get(model, obj.id) is None
+
+
+@pytest.mark.usefixtures('db_txn')
+def test_permission_control(client, admin_headers):
+    """测试权限控制：普通用户不能访问用户管理 API"""
+    username = 'test_normal_user'
     
-    for name, result in results:
-        status = "✓ 通过" if result else "✗ 失败"
-        print(f"  {name}: {status}")
-        if result:
-            passed += 1
-        else:
-            failed += 1
+    # 先用管理员创建一个普通用户，测试结束后由 db_txn 回滚，无需清理
+    assert_response(client.post('/api/users', headers=admin_headers, json={
+        'username': username,
+        'password': 'test123',
+        'role': 'user'
+    }))
     
-    print("\n" + "-" * 60)
-    print(f"  总计: {passed} 通过, {failed} 失败")
-    print("=" * 60)
+    # 用普通用户登录
+    data = assert_response(client.post('/api/auth/login', json={
+        'username': username,
+        'password': 'test123'
+    }))
+    user_headers = {'Authorization': f"Bearer {data['data']['token']}"}
     
-    return failed == 0
+    # 普通用户访问用户管理 API 应返回 403
+    assert_response(client.get('/api/users', headers=user_headers), 403)
 
 
 if __name__ == '__main__':
-    success = main()
-    sys.exit(0 if success else 1)
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,170 @@
+"""
+MQTT 转发服务测试
+
+在内存 SQLite 测试应用上直接调用消息处理函数，用假客户端记录发布的消息，
+再手动写出通讯日志队列和设备状态，检查转发 Topic 与数据库中的记录。
+"""
+import sys
+import os
+
+import pytest
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import db
+from app.models import Station, Device, AlarmLog, CommLog
+from app.services import mqtt_service
+from app.services.mqtt_service import dispatch_message, handle_indoor_message, handle_outdoor_message
+
+INDOOR_IMEI = '300000000000001'
+OUTDOOR_IMEIS = ['300000000000002', '300000000000003']
+
+
+class FakeClient:
+    """只记录 publish 调用的 MQTT 客户端"""
+    
+    def __init__(self):
+        self.published = []
+    
+    def publish(self, topic, payload, qos=0):
+        self.published.append((topic, payload))
+
+
+def clear_state():
+    """清空消息处理的进程内状态：设备缓存、待写回的设备状态和通讯日志队列"""
+    mqtt_service._device_cache.clear()
+    mqtt_service._station_device_cache.clear()
+    mqtt_service._pending_device_state.clear()
+    while not mqtt_service._comm_log_queue.empty():
+        mqtt_service._comm_log_queue.get_nowait()
+
+
+@pytest.fixture
+def mqtt_client(app, monkeypatch):
+    """假 MQTT 客户端，消息处理使用测试应用
+    
+    写入线程的批量写出直接使用 engine.begin()，不能加入 db_txn 的外层事务，
+    因此测试结束后清空本测试写入的表。
+    """
+    client = FakeClient()
+    monkeypatch.setattr(mqtt_service, 'flask_app', app)
+    monkeypatch.setattr(mqtt_service, 'mqtt_client', client)
+    clear_state()
+    yield client
+    clear_state()
+    with app.app_context():
+        for model in (CommLog, AlarmLog, Device, Station):
+            db.session.execute(db.delete(model))
+        db.session.commit()
+
+
+@pytest.fixture
+def station_id(app):
+    """一个加油站，绑定一台室内机和两台室外机，返回加油站 ID"""
+    with app.app_context():
+        station = Station(name='转发测试站', code='TEST_MQTT')
+        db.session.add(station)
+        db.session.flush()
+        db.session.add(Device(imei=INDOOR_IMEI, type='indoor', station_id=station.id))
+        db.session.add_all(Device(imei=imei, type='outdoor', station_id=station.id) for imei in OUTDOOR_IMEIS)
+        db.session.commit()
+        return station.id
+
+
+def flush():
+    """写出通讯日志队列和待写回的设备状态（代替后台写入线程）"""
+    batch = []
+    while not mqtt_service._comm_log_queue.empty():
+        batch.append(mqtt_service._comm_log_queue.get_nowait())
+    if batch:
+        mqtt_service.flush_comm_logs(batch)
+    mqtt_service.flush_device_state()
+
+
+def comm_logs(app):
+    """按写入顺序返回全部通讯日志的 (方向, 目标 IMEI, Topic, 内容)"""
+    with app.app_context():
+        return db.session.execute(
+            db.select(CommLog.direction, CommLog.target_imei, CommLog.topic, CommLog.payload).order_by(CommLog.id)
+        ).all()
+
+
+def device(app, imei):
+    """查询设备当前在数据库中的状态"""
+    with app.app_context():
+        return db.session.execute(db.select(Device).filter_by(imei=imei)).scalar_one()
+
+
+def test_indoor_message(app, mqtt_client, station_id):
+    """测试室内机报警消息：原始 bytes 转发给同站所有室外机，记录通讯日志和报警日志，更新在线时间"""
+    payload = b'{"bj":"1"}'
+    dispatch_message(handle_indoor_message, INDOOR_IMEI, payload)
+    
+    targets = [app.config['OUTDOOR_SUB_PREFIX'] + imei for imei in OUTDOOR_IMEIS]
+    assert mqtt_client.published == [(topic, payload) for topic in targets]
+    
+    flush()
+    assert comm_logs(app) == [
+        ('receive', None, app.config['INDOOR_PUB_PREFIX'] + INDOOR_IMEI, '{"bj":"1"}'),
+        *(('forward', imei, topic, '{"bj":"1"}') for imei, topic in zip(OUTDOOR_IMEIS, targets)),
+    ]
+    
+    with app.app_context():
+        alarm = db.session.execute(db.select(AlarmLog)).scalar_one()
+        assert (alarm.station_id, alarm.alarm_type, alarm.outdoor_imeis) == (station_id, 'alarm', OUTDOOR_IMEIS)
+    
+    assert device(app, INDOOR_IMEI).last_seen is not None
+
+
+def test_outdoor_message(app, mqtt_client, station_id):
+    """测试室外机消息：转发给同站室内机，电量和在线时间在写回后落库"""
+    payload = b'{"vbat":3.7}'
+    dispatch_message(handle_outdoor_message, OUTDOOR_IMEIS[0], payload)
+    
+    assert mqtt_client.published == [(app.config['INDOOR_SUB_PREFIX'] + INDOOR_IMEI, payload)]
+    # 写回前数据库中的电量不变
+    assert device(app, OUTDOOR_IMEIS[0]).vbat is None
+    
+    flush()
+    outdoor = device(app, OUTDOOR_IMEIS[0])
+    assert outdoor.vbat == 3.7
+    assert outdoor.last_seen is not None
+    assert [row.direction for row in comm_logs(app)] == ['receive', 'forward']
+
+
+def test_unknown_device_invalid_utf8(app, mqtt_client):
+    """测试未知设备发送非 UTF-8 消息：自动注册、不转发，通讯日志按替换字符保存"""
+    imei = '300000000000009'
+    dispatch_message(handle_indoor_message, imei, b'\xff\xfe{"bj":1}')
+    
+    assert mqtt_client.published == []
+    flush()
+    assert comm_logs(app) == [
+        ('receive', None, app.config['INDOOR_PUB_PREFIX'] + imei, '\ufffd\ufffd{"bj":1}'),
+    ]
+    
+    registered = device(app, imei)
+    assert (registered.type, registered.station_id) == ('indoor', None)
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).select_from(AlarmLog)) == 0
+
+
+def test_device_type_mismatch(app, mqtt_client, station_id):
+    """测试设备类型不符：室内机从室外机主题发消息时修正类型并解绑，不转发"""
+    # 先各处理一条正常消息，使室内机及该站的室内机转发目标进入缓存
+    dispatch_message(handle_indoor_message, INDOOR_IMEI, b'{}')
+    dispatch_message(handle_outdoor_message, OUTDOOR_IMEIS[0], b'{}')
+    assert mqtt_client.published[-1] == (app.config['INDOOR_SUB_PREFIX'] + INDOOR_IMEI, b'{}')
+    mqtt_client.published.clear()
+    
+    dispatch_message(handle_outdoor_message, INDOOR_IMEI, b'{"vbat":3.6}')
+    
+    assert mqtt_client.published == []
+    flush()
+    changed = device(app, INDOOR_IMEI)
+    assert (changed.type, changed.station_id, changed.vbat) == ('outdoor', None, 3.6)
+    
+    # 缓存同步更新：同站室外机的消息不再转发给已解绑的设备
+    dispatch_message(handle_outdoor_message, OUTDOOR_IMEIS[0], b'{}')
+    assert mqtt_client.published == []
@@ -0,0 +1,16 @@
+"""
+WSGI 入口文件（生产环境）
+
+启动方式:
+    gunicorn -c gunicorn.conf.py wsgi:app
+    python mqtt_worker.py  # MQTT 转发服务，单独运行一个进程
+"""
+import os
+import sys
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+
+app = create_app(os.environ.get('FLASK_ENV') or 'production')